@@ -13,5 +13,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 
-from .bibtex import BibtexParser, parse_bibtex
-from .person import PersonName
+from .bibtex import BibtexParser, parse_bibtex, iterparse_bibtex, iterparse_bibtex_parallel
+from .person import PersonName, NameCache
+from .index import TitleIndex
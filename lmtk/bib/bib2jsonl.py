@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+lmtk.bib.bib2jsonl
+~~~~~~~~~~~~~~~~~~
+
+Command line tool to convert BibTeX files to JSON Lines, parsing in parallel.
+
+:copyright: Copyright 2014 by Matt Swain.
+:license: MIT, see LICENSE file for more details.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import argparse
+import json
+from multiprocessing import Pool, cpu_count
+import sys
+
+from .bibtex import iterparse_bibtex_parallel
+
+
+def main(argv=None):
+    """Write the records in each BibTeX file to stdout or an output file as JSON Lines, one record per line.
+
+    Each file is read into memory in full before it is parsed, because the IDs of all its records are needed up front to
+    put a duplicated record in the position of the first, just like parse_bibtex. Records are written as soon as they
+    are parsed, and one pool of worker processes is shared by all the files.
+    """
+    parser = argparse.ArgumentParser(description='Convert BibTeX files to JSON Lines.')
+    parser.add_argument('files', nargs='+', help='BibTeX files to convert')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=cpu_count(), help='number of worker processes')
+    parser.add_argument('-b', '--batchsize', type=int, default=100, help='number of entries per worker task')
+    args = parser.parse_args(argv)
+    pool = Pool(args.workers) if args.workers > 1 else None
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for path in args.files:
+            with open(path, 'rb') as f:
+                data = f.read()
+            for record in iterparse_bibtex_parallel(data, workers=args.workers, batchsize=args.batchsize, pool=pool):
+                out.write(json.dumps(record))
+                out.write('\n')
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,7 +13,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 from collections import OrderedDict
+import codecs
 import json
+from multiprocessing import Pool
 import re
 
 from lmtk.text import u, latex_to_unicode
@@ -30,9 +32,15 @@ class BibtexParser():
             bib.parse()
             print bib.records_list
             print bib.json
+
+    Large files can be parsed incrementally, yielding each record as soon as it is complete:
+
+        with open(example.bib, 'rb') as f:
+            for record in BibtexParser().iter_records(f):
+                print record
     """
 
-    def __init__(self, data, **kwargs):
+    def __init__(self, data=None, **kwargs):
         """Initialize BibtexParser with data.
 
         Optional metadata passed as keyword arguments will be included in the JSON output.
@@ -43,11 +51,13 @@ class BibtexParser():
             bib = BibtexParser(data, created=unicode(datetime.utcnow()), owner='mcs07')
 
         """
-        self.data = u(data)
+        self.data = u(data) if data is not None else None
         self.meta = kwargs
         self._token = None
         self.token_type = None
-        self._tokens = re.compile(r'([^\s"\'#%@{}()=,]+|\s|"|\'|#|%|@|{|}|\(|\)|=|,)').finditer(self.data)
+        self._tokens = (m.group(0) for m in TOKEN_RE.finditer(self.data)) if self.data is not None else iter(())
+        self._record = None
+        self._offset = None
         self.mode = None
         self.definitions = {}
         self.records = OrderedDict()
@@ -66,26 +76,165 @@ class BibtexParser():
 
     def _next_token(self, skipws=True):
         """Increment _token to the next token and return it."""
-        self._token = self._tokens.next().group(0)
+        self._token = self._tokens.next()
         return self._next_token() if skipws and self._token.isspace() else self._token
 
+    def _read_tokens(self, fileobj, chunksize, encoding):
+        """Generate tokens from a file object, reading a chunk at a time.
+
+        The last token in each chunk is held back until the next chunk is read, in case it continues across the chunk
+        boundary. Byte strings are decoded incrementally so multi-byte characters can also span chunk boundaries.
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+        pending = ''
+        while True:
+            chunk = fileobj.read(chunksize)
+            data = decoder.decode(chunk, final=not chunk) if isinstance(chunk, bytes) else chunk
+            tokens = TOKEN_RE.findall(pending + data)
+            pending = tokens.pop() if tokens and chunk else ''
+            for token in tokens:
+                yield token
+            if not chunk:
+                break
+
     def parse(self):
         """Parse self.data and store the parsed BibTeX to self.records."""
+        for record in self.iter_records():
+            self.records[record[u'id']] = record
+
+    def iter_records(self, fileobj=None, chunksize=65536, encoding='utf-8'):
+        """Parse BibTeX and yield each record as soon as it is complete.
+
+        Records are not stored in self.records, so memory usage is independent of the number of records. @string
+        definitions are stored in self.definitions and apply to all subsequent records.
+
+        :param fileobj: A file object to read from in chunks. If None, parse self.data.
+        :param chunksize: The number of bytes or characters to read from the file object at a time.
+        :param encoding: The encoding used to decode the file object if it is opened in binary mode.
+        """
+        if fileobj is not None:
+            self._tokens = self._read_tokens(fileobj, chunksize, encoding)
         while True:
             try:
                 # TODO: If self._next_token() == '%' skip to newline?
-                if self._next_token() == '@':
-                    self._parse_entry()
+                record = self._parse_entry() if self._next_token() == '@' else None
             except StopIteration:
+                # Keep any partial record at the end of the input
+                if self._record:
+                    yield self._record
                 break
+            if record:
+                yield record
+
+    def split(self, batchsize=100):
+        """Split self.data at top-level entry boundaries into batches that can be parsed independently.
+
+        Entries are only scanned for their structure, which is much faster than a full parse. Each batch is returned
+        along with a copy of the @string definitions in effect at its start, so parsing it with a fresh BibtexParser
+        gives the same records as a full parse of self.data.
+
+        :param batchsize: The maximum number of entries in each batch.
+        :returns: A list of (definitions, data) batches, and a list of the ID of every record in the order they appear.
+        """
+        batches, ids = [], []
+        start, count, definitions = 0, 0, dict(self.definitions)
+        pos = self.data.find('@')
+        while pos != -1:
+            if count == batchsize:
+                batches.append((definitions, self.data[start:pos]))
+                start, count, definitions = pos, 0, dict(self.definitions)
+            count += 1
+            pos, record_id = self._skim_entry(pos + 1)
+            if record_id is not None:
+                ids.append(record_id)
+            if pos is None:
+                break
+            pos = self.data.find('@', pos)
+        if count:
+            batches.append((definitions, self.data[start:]))
+        return batches, ids
+
+    def _skim_token(self, pos):
+        """Return the next non-whitespace token in self.data from pos and the position after it."""
+        while True:
+            m = SKIM_TOKEN_RE.match(self.data, pos)
+            if not m:
+                raise StopIteration
+            token, pos = m.group(1), m.end()
+            if not token.isspace():
+                return token, pos
+
+    def _skim_entry(self, pos):
+        """Scan the entry that starts at pos, following the same rules as _parse_entry but skipping over values.
+
+        String entries are parsed in full so self.definitions stays up to date. Return the position after the entry
+        (or None if the end of the data is reached) and the record ID (or None if the entry is not a record).
+        """
+        record_id = None
+        try:
+            entry_type, pos = self._skim_token(pos)
+            entry_type = entry_type.lower()
+            if entry_type == 'string':
+                self._tokens = self._offset_tokens(pos)
+                self._parse_string()
+                return self._offset + len(self._token), None
+            elif entry_type in ['comment', 'preamble']:
+                return pos, None
+            t, pos = self._skim_token(pos)
+            if t not in ['{', '(']:
+                return pos, None
+            record_id, pos = self._skim_token(pos)
+            t, pos = self._skim_token(pos)
+            if t == ',':
+                while True:
+                    # Field name, then the value if followed by =
+                    t, pos = self._skim_token(pos)
+                    t, pos = self._skim_token(pos)
+                    if t == '=':
+                        t, pos = self._skim_value(pos)
+                    if t != ',':
+                        break
+            return pos, record_id
+        except StopIteration:
+            return None, record_id
+
+    def _skim_value(self, pos):
+        """Skip over a value, following the same rules as _parse_value. Return the token after it and its end position."""
+        while True:
+            t, pos = self._skim_token(pos)
+            if t == '"' or t == '{':
+                # Jump between quote and curly bracket characters rather than stepping through every token
+                brac_counter = 0
+                while True:
+                    m = (QUOTED_VALUE_RE if t == '"' else BRACED_VALUE_RE).search(self.data, pos)
+                    if not m:
+                        raise StopIteration
+                    c, pos = m.group(0), m.end()
+                    if c == '{':
+                        brac_counter += 1
+                    elif c == '}':
+                        brac_counter -= 1
+                        if t == '{' and brac_counter < 0:
+                            break
+                    elif brac_counter <= 0:
+                        break
+            elif not (WORD_RE.match(t) or t.isdigit() or t == '#'):
+                return t, pos
+
+    def _offset_tokens(self, pos):
+        """Generate tokens from self.data starting at pos, keeping track of the offset of each token in self._offset."""
+        for m in TOKEN_RE.finditer(self.data, pos):
+            self._offset = m.start()
+            yield m.group(0)
 
     def _parse_entry(self):
-        """Parse an entry."""
+        """Parse an entry. Return the record if the entry is a record."""
+        self._record = None
         entry_type = self._next_token().lower()
         if entry_type == 'string':
             self._parse_string()
         elif entry_type not in ['comment', 'preamble']:
-            self._parse_record(entry_type)
+            return self._parse_record(entry_type)
 
     def _parse_string(self):
         """Parse a string entry and store the definition."""
@@ -95,10 +244,10 @@ class BibtexParser():
                 self.definitions[field[0]] = field[1]
 
     def _parse_record(self, record_type):
-        """Parse a record."""
+        """Parse a record and return it."""
         if self._next_token() in ['{', '(']:
             key = self._next_token()
-            self.records[key] = {
+            self._record = {
                 u'id': key,
                 u'type': record_type.lower()
             }
@@ -118,9 +267,11 @@ class BibtexParser():
                         #     v = latex_to_unicode(v, capitalize='title')
                         else:
                             v = latex_to_unicode(v)
-                        self.records[key][k] = v
+                        self._record[k] = v
                     if self._token != ',':
                         break
+            record, self._record = self._record, None
+            return record
 
     def _parse_field(self):
         """Parse a Field."""
@@ -209,4 +360,69 @@ def parse_bibtex(data):
     bib.parse()
     return bib.records_list
 
+
+def iterparse_bibtex(path, **kwargs):
+    """Yield each record in the BibTeX file at the given path, reading the file incrementally.
+
+    Keyword arguments are passed to `BibtexParser.iter_records`.
+    """
+    with open(path, 'rb') as f:
+        for record in BibtexParser().iter_records(f, **kwargs):
+            yield record
+
+
+def _parse_batch(batch):
+    """Parse a (definitions, data) batch from BibtexParser.split and return a list of records."""
+    definitions, data = batch
+    bib = BibtexParser(data)
+    bib.definitions = definitions
+    return list(bib.iter_records())
+
+
+def iterparse_bibtex_parallel(data, workers=None, batchsize=100, pool=None):
+    """Parse BibTeX in parallel and yield the records in the same order as parse_bibtex.
+
+    The data is split into batches of entries that are parsed in a pool of worker processes. Records are yielded as
+    soon as they are available, except where a record ID is duplicated, in which case the later record replaces the
+    earlier one in its original position, just like parse_bibtex.
+
+    The whole of data is needed up front, because it is split into batches and its record IDs are found before any
+    record is yielded.
+
+    :param data: A BibTeX string.
+    :param workers: The number of worker processes. Defaults to the number of CPUs. If 1, parse in this process.
+    :param batchsize: The maximum number of entries to send to a worker at a time.
+    :param pool: An existing multiprocessing Pool to use instead of creating a new one. If given, workers is ignored.
+    """
+    batches, ids = BibtexParser(data).split(batchsize)
+    last = dict((record_id, i) for i, record_id in enumerate(ids))
+    order = list(OrderedDict.fromkeys(ids))
+    own_pool = pool is None and workers != 1
+    if own_pool:
+        pool = Pool(workers)
+    try:
+        results = pool.imap(_parse_batch, batches) if pool else (_parse_batch(batch) for batch in batches)
+        # Records are held in pending until every earlier record in the output order has been yielded
+        pending = {}
+        i, j = 0, 0
+        for records in results:
+            for record in records:
+                if last[record[u'id']] == i:
+                    pending[record[u'id']] = record
+                i += 1
+            while j < len(order) and order[j] in pending:
+                yield pending.pop(order[j])
+                j += 1
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+
+TOKEN_RE = re.compile(r'([^\s"\'#%@{}()=,]+|\s|"|\'|#|%|@|{|}|\(|\)|=|,)')
+QUOTED_VALUE_RE = re.compile(r'[{}"]')
+BRACED_VALUE_RE = re.compile(r'[{}]')
+SKIM_TOKEN_RE = re.compile(r'\s*' + TOKEN_RE.pattern)
+WORD_RE = re.compile(r'\w')
+
 # TODO: BibtexWriter - write python dict or BibJSON to BibTeX
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+lmtk.bib.index
+~~~~~~~~~~~~~~
+
+An index for finding records with similar titles, for fuzzy deduplication.
+
+:copyright: Copyright 2014 by Matt Swain.
+:license: MIT, see LICENSE file for more details.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from collections import Counter
+import pickle
+
+from lmtk.text import dequirk_string, levenshtein_many
+
+
+class TitleIndex(object):
+    """An inverted index of character n-grams in dequirked titles for finding near-duplicate titles.
+
+    Rather than comparing a title against every title in a collection, candidates are found by counting the n-grams they
+    share with the query. Each edit can change at most n of the n-grams in a title, so titles within a given edit
+    distance must share a minimum number of n-grams. Only these candidates are then verified with `levenshtein`.
+
+    Example usage:
+
+        index = TitleIndex()
+        index.add('10.1039/C3CE27013K', 'Polymorphism of glycine-glutaric acid co-crystals')
+        print index.query('Polymorphism of glycine glutaric acid cocrystals', max_distance=3)
+        index.save('titles.pickle')
+        index = TitleIndex.load('titles.pickle')
+
+    """
+
+    def __init__(self, n=3):
+        """Initialize an empty index.
+
+        :param n: The length of the character n-grams to index.
+
+        """
+        self.n = n
+        self._titles = {}
+        self._lengths = {}
+        self._grams = {}
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __contains__(self, id):
+        return id in self._titles
+
+    def _ngrams(self, text):
+        """Return a Counter of the n-grams in text."""
+        return Counter(text[i:i + self.n] for i in range(len(text) - self.n + 1))
+
+    def add(self, id, title):
+        """Add a title to the index, replacing any existing title with the same id."""
+        if id in self._titles:
+            self.remove(id)
+        text = dequirk_string(title)
+        self._titles[id] = text
+        self._lengths.setdefault(len(text), set()).add(id)
+        for gram, count in self._ngrams(text).items():
+            self._grams.setdefault(gram, {})[id] = count
+
+    def remove(self, id):
+        """Remove the title with the given id from the index."""
+        text = self._titles.pop(id)
+        self._lengths[len(text)].discard(id)
+        for gram in self._ngrams(text):
+            del self._grams[gram][id]
+            if not self._grams[gram]:
+                del self._grams[gram]
+
+    def candidates(self, title, max_distance):
+        """Return the set of ids with titles that could be within max_distance of title.
+
+        The candidates are not verified, so may include titles that are further away.
+        """
+        text = dequirk_string(title)
+        length = len(text)
+        lengths = range(max(length - max_distance, 0), length + max_distance + 1)
+        if length - self.n + 1 - max_distance * self.n <= 0:
+            # Too short for any n-grams to be guaranteed in common, so fall back to filtering by length alone
+            return set(id for l in lengths for id in self._lengths.get(l, ()))
+        # A match can miss at most max_distance * n of the n-grams in the query, so it must share at least one of the
+        # first max_distance * n + 1. Only these rarest n-grams are used to find candidates, the rest just add counts.
+        grams = sorted(self._ngrams(text).items(), key=lambda gram: len(self._grams.get(gram[0], ())))
+        prefix = max_distance * self.n + 1
+        seen = 0
+        shared = Counter()
+        for gram, count in grams:
+            postings = self._grams.get(gram, {})
+            if seen < prefix:
+                for id, other_count in postings.items():
+                    shared[id] += min(count, other_count)
+            elif len(postings) < len(shared):
+                for id, other_count in postings.items():
+                    if id in shared:
+                        shared[id] += min(count, other_count)
+            else:
+                for id in shared:
+                    if id in postings:
+                        shared[id] += min(count, postings[id])
+            seen += count
+        candidates = set()
+        for id, count in shared.items():
+            other_length = len(self._titles[id])
+            if (abs(other_length - length) <= max_distance and
+                    count >= max(length, other_length) - self.n + 1 - max_distance * self.n):
+                candidates.add(id)
+        return candidates
+
+    def query(self, title, max_distance):
+        """Return a list of (id, distance) tuples for titles within max_distance of title, closest first.
+
+        Distances are Levenshtein distances between dequirked titles.
+        """
+        ids = list(self.candidates(title, max_distance))
+        by_title = {}
+        for id in ids:
+            by_title.setdefault(self._titles[id], []).append(id)
+        matches = []
+        for text, distance in levenshtein_many(dequirk_string(title), by_title, max_distance):
+            matches.extend((id, distance) for id in by_title[text])
+        return sorted(matches, key=lambda match: match[1])
+
+    def save(self, path):
+        """Pickle the index to a file."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, -1)
+
+    @classmethod
+    def load(cls, path):
+        """Load a pickled index from a file."""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -12,8 +12,10 @@ Tools for parsing people's names from strings into various name components.
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
+from collections import OrderedDict
 import re
 import string
+import threading
 
 from lmtk.text import QUOTES, normalize, latex_to_unicode, u, s
 
@@ -59,6 +61,52 @@ SUFFIXES_LOWER = {suf.lower() for suf in SUFFIXES}
 NOT_SUFFIX = {'I.', 'V.'}
 
 
+class NameCache(object):
+    """A size-bounded, thread-safe least recently used cache of parsed name components.
+
+    Keys are (name, from_bibtex) tuples and values are dicts of name components. Values are copied on the way in and
+    out, so mutating a parsed PersonName can never change the result of a later cache hit.
+    """
+
+    def __init__(self, maxsize=10000):
+        """Initialize with the maximum number of names to keep."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        """Return a copy of the components cached for key, or None if not cached."""
+        with self._lock:
+            components = self._cache.pop(key, None)
+            if components is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Reinsert to mark as most recently used
+            self._cache[key] = components
+            return dict(components)
+
+    def set(self, key, components):
+        """Cache a copy of the components for key, discarding the least recently used entry if full."""
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = dict(components)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the hit and miss counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class PersonName(dict):
     """Class for parsing a person's name into its constituent parts.
 
@@ -89,8 +137,13 @@ class PersonName(dict):
     This class was written with the intention of parsing BibTeX author names, so name components enclosed within curly
     brackets will not be split.
 
+    Parsed components are cached in the shared `PersonName.cache`, so repeated names are only parsed once. Set it to None
+    to disable caching.
+
     """
 
+    cache = NameCache()
+
     # Useful info at  http://nwalsh.com/tex/texhelp/bibtx-23.html
 
     # Issues:
@@ -142,7 +195,17 @@ class PersonName(dict):
     @name.setter
     def name(self, name):
         self.clear()
-        self._parse(u(name))
+        name = u(name)
+        if self.cache is None:
+            self._parse(name)
+            return
+        key = (name, self._from_bibtex)
+        components = self.cache.get(key)
+        if components is None:
+            self._parse(name)
+            self.cache.set(key, self)
+        else:
+            self.update(components)
 
     def __getattr__(self, name):
         if name in {u'title', u'firstname', u'middlename', u'nickname', u'prefix', u'lastname', u'suffix'}:
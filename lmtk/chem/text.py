@@ -114,7 +114,7 @@ SOLVENTS = {
     u'tetramethylsilane', u'tetramethylurea', u'tetrapiperidine', u'TFA', u'TFE', u'THF', u'THF-d8', u'tin dioxide',
     u'titanium dioxide', u'toluene', u'tri-n-butyl phosphate', u'triacetate', u'triacetin', u'tribromomethane',
     u'tributyl phosphate', u'trichlorobenzene', u'trichloroethene', u'trichloromethane', u'triethyl amine',
-    u'triethyl phosphate', u'triethylamine', u'trifluoroacetic acid', u'trifluoroethanol', u'trifluoroethanol ',
+    u'triethyl phosphate', u'triethylamine', u'trifluoroacetic acid', u'trifluoroethanol',
     u'trimethyl benzene', u'trimethyl pentane', u'tris', u'Triton X-100', u'TX-100', u'undecan-1-ol', u'undecanol',
     u'valeronitrile', u'water', u'xylene', u'xylol'
 }
@@ -124,8 +124,8 @@ PREFIXES = {u'iso', u'tert', u'sec', u'ortho', u'meta', u'para', u'meso'}
 
 # A regular expression that matches common solvents.
 SOLVENT_RE = re.compile(ur'(?:^|\b)(?:(?:%s|d\d?\d?|[\dn](?:,[\dn]){0,3}|[imnoptDLRS])-?)?(?:%s)(?:-d\d?\d?)?(?=$|\b)'
-                        % ('|'.join(re.escape(s) for s in PREFIXES),
-                           '|'.join(re.escape(s).replace(ur'\ ', ur'[\s\-]?') for s in SOLVENTS)), re.I)
+                        % (text.trie_pattern(PREFIXES, ignorecase=True),
+                           text.trie_pattern(SOLVENTS, ignorecase=True, fragments={' ': ur'[\s\-]?'})), re.I)
 
 # Regular expressions for validating chemical identifiers
 CAS_RE = re.compile(r'^\d{1,7}-\d\d-\d$')
@@ -137,55 +137,295 @@ SMILES_RE = re.compile(r'^([BCNOPSFIbcnosp*]|Cl|Br|\[\d*(%(e)s|se|as|\*)(@+([THA
                        r'([BCNOPSFIbcnosp*]|Cl|Br|\[\d*(%(e)s|se|as|\*)(@+([THALSPBO]\d+)?)?(H\d?)?([\-+]+\d*)?(:\d+)?\]|'
                        r'[\-=#$:\\/\(\)%%\.+\d])*$' % {'e': '|'.join(ELEMENT_SYMBOLS)})
 
+# Character sets used by the linear-time identifier validators
+DIGITS = frozenset(u'0123456789')
+SMILES_ORGANIC = frozenset(u'BCNOPSFIbcnosp*')
+SMILES_BONDS = frozenset(u'-=#$:\\/.+')
+SMILES_PLAIN = SMILES_ORGANIC | SMILES_BONDS | DIGITS | frozenset(u'lr()%')
+SMILES_BRACKET_ATOMS = ELEMENT_SYMBOLS | {u'se', u'as', u'*'}
+SMILES_CHIRAL_CLASSES = frozenset(u'THALSPBO')
+INCHI_LETTERS = frozenset(u'abcdefghiklmnopqrstuvwxyzABCDEFGHIKLMNOPQRSTUVWXYZ')
+INCHI_FORMULA = INCHI_LETTERS | DIGITS | {u'.'}
+INCHI_CONNECTIONS = DIGITS | frozenset(u'-*(),;')
+
+# Each InChI layer key maps to its allowed characters, whether it may be empty, and the keys of the optional sublayers
+# that may follow it, in order. The last character of a key is the prefix letter of the layer.
+INCHI_LAYERS = {
+    u'c': (INCHI_CONNECTIONS, False, ()),
+    u'h': (INCHI_CONNECTIONS | frozenset(u'hH'), False, ()),
+    u'ih': (DIGITS | frozenset(u'hdtHDT'), False, ()),
+    u'i': (DIGITS | frozenset(u'hdtHDT-+*,;'), True, (u'ih',)),
+    u'r': (INCHI_LETTERS | DIGITS, False, (u'c', u'h')),
+    u'f': (INCHI_LETTERS | DIGITS, True, (u'h',)),
+}
+INCHI_LAYERS.update(dict.fromkeys(u'bmpqst', (DIGITS | frozenset(u'-.+*,;?'), True, ())))
+INCHI_TOP_LAYERS = frozenset(u'bmpqstirf')
+
+
+# Patterns used by normalize, compiled once on import
+
+# Variant spellings of element names, rewritten to the IUPAC spelling in lower case
+SPELLING_RE = re.compile(ur'(sulph)|(aluminum)|(cesium)', re.I)
+SPELLINGS = {1: u'sulf', 2: u'aluminium', 3: u'caesium'}
+
+# Space between element and oxidation state (copper (II) --> copper(II))
+OXSTATE_SPACE_RE = re.compile(ur'(%s) \((\d[+-]|[+-]\d|0|I{1,3}|IV|VI{1,3}|IX)\)' % '|'.join(ELEMENTS), re.I)
+
+# Numeric quantity followed by units (only applies with certain characters before and after). Each pass consumes the
+# characters either side of a quantity, so one pass can hide a quantity from the next and the passes must stay separate.
+QUANTITY_RE = re.compile(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)((?:(?:(?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)-)?(?:[0-9]|[1-9][0-9]+)'
+                         ur'(?:\.\d+)?|\.\d+)([cdGkmMnpTuμ]?(?:[JlLMmNVW]|[Gg]ramm?e?s?|Hz|[Mm][Oo][Ll](?:e|ar)?s?|h?Pa|ppm)'
+                         ur'(?:-?\d)?)($|[^\w<\-])')
+# Stricter rules for g and s, as they often occur in other contexts
+QUANTITY_G_RE = re.compile(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)((?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)([kmnuμ]?(?:g)(?:-?\d)?)'
+                           ur'($|[^\w<\-])')
+QUANTITY_S_RE = re.compile(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)(?![12]s)((?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)'
+                           ur'([mnpuμ]?(?:s)(?:-?\d)?)($|[^\w<\-])')
+# Every quantity has a digit directly followed by one of these characters, so a single scan for them finds which of the
+# quantity passes could match at all
+QUANTITY_HINT_RE = re.compile(ur'(?<=\d)[cdGgkmMnpTuμJlLNVWHhPs]')
+QUANTITY_PASSES = (
+    (QUANTITY_RE, frozenset(u'cdGgkmMnpTuμJlLNVWHhP')),
+    (QUANTITY_G_RE, frozenset(u'kmnuμg')),
+    (QUANTITY_S_RE, frozenset(u'mnpuμs')),
+)
+
+# Space between numeric quantity and percentage, between pH and value, and around temperature units ("10° C" to
+# "10 °C"), and space followed by combining overdot. Each alternative only consumes the characters it rewrites, so they
+# can share a single scan. A percentage can also match the end of a pH value (pH-7% or pH7.5%), so pH includes it.
+UNIT_SPACE_RE = re.compile(ur'\b(?P<percent>-?\d+(?:\.\d+)?|\d*\.\d+)%(?=$|[^\w])|'
+                           ur'\b(?P<ph>ph)(?P<phvalue>-?\d+(?:\.\d+)?)\b(?P<phpercent>%(?=$|[^\w]))?|'
+                           ur'(?<=\d)\s*(?P<degree>[°º])\s*(?P<scale>[cf]?)(?=$|[^\w])|'
+                           ur'(?P<overdot> \u0307)', re.I)
+
+
+def _replace_spelling(match):
+    return SPELLINGS[match.lastindex]
+
+
+def _replace_unit_space(match):
+    percent, ph, degree = match.group('percent', 'ph', 'degree')
+    if percent is not None:
+        return u'%s %%' % percent
+    if ph is not None:
+        value, percent = match.group('phvalue', 'phpercent')
+        if percent and ('-' in value or '.' in value):
+            percent = u' %'
+        return u'%s %s%s' % (ph, value, percent or u'')
+    if degree is not None:
+        return u' %s%s' % (degree, match.group('scale'))
+    return u'\u02d9'
+
 
 def normalize(s):
     """Normalize unicode, hyphens, whitespace, and some chemistry terms and formatting."""
     # Perform the standard text normalization
     s = text.normalize(s)
     # Normalize element spelling
-    s = re.sub(ur'sulph', ur'sulf', s, flags=re.I)
-    s = re.sub(ur'aluminum', ur'aluminium', s, flags=re.I)
-    s = re.sub(ur'cesium', ur'caesium', s, flags=re.I)
-    # Remove space between element and oxidation state (copper (II) --> copper(II))
-    s = re.sub(ur'(%s) \((\d[+-]|[+-]\d|0|I{1,3}|IV|VI{1,3}|IX)\)' % '|'.join(ELEMENTS), ur'\1(\2)', s, flags=re.I)
-    # Add space between numeric quantity and units (Only applies with certain characters before and after)
-    s = re.sub(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)((?:(?:(?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)-)?(?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)'
-               ur'([cdGkmMnpTuμ]?(?:[JlLMmNVW]|[Gg]ramm?e?s?|Hz|[Mm][Oo][Ll](?:e|ar)?s?|h?Pa|ppm)(?:-?\d)?)($|[^\w<\-])',
-               ur'\1\2\3 \4\5', s)
-    # Stricter rules for g and s, as they often occur in other contexts
-    s = re.sub(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)((?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)([kmnuμ]?(?:g)(?:-?\d)?)($|[^\w<\-])',
-               ur'\1\2\3 \4\5', s)
-    s = re.sub(ur'(^|[^\w>\-∼~≈)])([∼~≈]?)(?![12]s)((?:[0-9]|[1-9][0-9]+)(?:\.\d+)?|\.\d+)([mnpuμ]?(?:s)(?:-?\d)?)($|[^\w<\-])',
-               ur'\1\2\3 \4\5', s)
-    # Add space between numeric quantity and percentage
-    s = re.sub(ur'\b(-?\d+(\.\d+)?|\d*\.\d+)%($|[^\w])', ur'\1 %\3', s)
-    # Add space between pH and value
-    s = re.sub(ur'\b(ph)(-?\d+(\.\d+)?)\b', ur'\1 \2', s, flags=re.I)
-    # Normalise whitespace around temperature units ("10° C" to "10 °C")
-    s = re.sub(ur'(\d)\s*([°º])\s*([cf]?)($|[^\w])', ur'\1 \2\3\4', s, flags=re.I)
-    # Normalise space followed by combining character to the single combined character
-    s = re.sub(ur' \u0307', ur'\u02d9', s)
-    return s
+    s = SPELLING_RE.sub(_replace_spelling, s)
+    # Remove space between element and oxidation state
+    if ' (' in s:
+        s = OXSTATE_SPACE_RE.sub(ur'\1(\2)', s)
+    # Add space between numeric quantity and units, skipping passes that can't match
+    hints = set(QUANTITY_HINT_RE.findall(s))
+    for quantity_re, chars in QUANTITY_PASSES:
+        if not chars.isdisjoint(hints):
+            s = quantity_re.sub(ur'\1\2\3 \4\5', s)
+    # Add space in percentages, pH values and temperatures, and combine space with overdot
+    return UNIT_SPACE_RE.sub(_replace_unit_space, s)
+
+
+def _bracket_atom_end(s, i):
+    """Return the index after the SMILES bracket atom that starts at s[i], or -1 if it isn't valid."""
+    n = len(s)
+    i += 1
+    # Isotope
+    while i < n and s[i] in DIGITS:
+        i += 1
+    # Element symbols have a lower case second letter, so a two letter match can't steal from what follows
+    if s[i:i + 2] in SMILES_BRACKET_ATOMS:
+        i += 2
+    elif s[i:i + 1] in SMILES_BRACKET_ATOMS:
+        i += 1
+    else:
+        return -1
+    # Chirality, with an optional class like @TH1
+    if s.startswith(u'@', i):
+        while s.startswith(u'@', i):
+            i += 1
+        if i + 1 < n and s[i] in SMILES_CHIRAL_CLASSES and s[i + 1] in DIGITS:
+            i += 2
+            while i < n and s[i] in DIGITS:
+                i += 1
+    # Hydrogen count
+    if s.startswith(u'H', i):
+        i += 1
+        if i < n and s[i] in DIGITS:
+            i += 1
+    # Charge
+    if i < n and s[i] in u'+-':
+        while i < n and s[i] in u'+-':
+            i += 1
+        while i < n and s[i] in DIGITS:
+            i += 1
+    # Atom class
+    if i + 1 < n and s[i] == u':' and s[i + 1] in DIGITS:
+        i += 2
+        while i < n and s[i] in DIGITS:
+            i += 1
+    return i + 1 if s.startswith(u']', i) else -1
+
+
+def _balanced(s):
+    """Return True if every parenthesis in the string is closed after it is opened."""
+    depth = 0
+    for c in s:
+        if c == u'(':
+            depth += 1
+        elif c == u')':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def is_smiles(s):
+    """Return True if the string is a valid SMILES string.
+
+    The string is scanned once from left to right. It must contain only the atoms and bonds allowed by SMILES_RE, but
+    branch parentheses must also be balanced and every ring closure number must be paired.
+    """
+    if not s or s[0] not in SMILES_ORGANIC and s[0] != u'[':
+        return False
+    # Outside bracket atoms only a few letters are allowed, which rules out most words without scanning them
+    if u'[' not in s and not SMILES_PLAIN.issuperset(s):
+        return False
+    n = len(s)
+    depth = 0
+    rings = set()
+    i = 0
+    while i < n:
+        c = s[i]
+        if c == u'[':
+            i = _bracket_atom_end(s, i)
+            if i < 0:
+                return False
+            continue
+        if c in SMILES_ORGANIC:
+            if (c == u'C' and s.startswith(u'l', i + 1)) or (c == u'B' and s.startswith(u'r', i + 1)):
+                i += 1
+        elif c in DIGITS or c == u'%':
+            if c == u'%':
+                c = s[i + 1:i + 3]
+                if len(c) < 2 or c[0] not in DIGITS or c[1] not in DIGITS:
+                    return False
+                i += 2
+            ring = int(c)
+            if ring in rings:
+                rings.remove(ring)
+            else:
+                rings.add(ring)
+        elif c == u'(':
+            depth += 1
+        elif c == u')':
+            depth -= 1
+            if depth < 0:
+                return False
+        elif c not in SMILES_BONDS:
+            return False
+        i += 1
+    return depth == 0 and not rings
+
+
+def is_inchi(s):
+    """Return True if the string is a valid InChI identifier.
+
+    The string is split into its layers, and each layer is checked by its prefix letter against the characters it may
+    contain and the layers it may follow. This accepts the same identifiers as INCHI_RE, except that parentheses must
+    also be balanced within each layer.
+    """
+    if s[:6].lower() == u'inchi=':
+        s = s[6:]
+    if s[:3].lower() == u'1s/':
+        layers = s[3:].split(u'/')
+    elif s[:2] == u'1/':
+        layers = s[2:].split(u'/')
+    else:
+        return False
+    formula = layers[0]
+    if formula.lower() == u'p+1':
+        following = ()
+    else:
+        formula = formula.lstrip(u'0123456789')
+        if not formula or formula[0] not in INCHI_LETTERS or not INCHI_FORMULA.issuperset(formula):
+            return False
+        following = (u'c', u'h')
+    for layer in layers[1:]:
+        prefix = layer[:1].lower()
+        for i, key in enumerate(following):
+            if key[-1] == prefix:
+                following = following[i + 1:]
+                break
+        else:
+            if prefix not in INCHI_TOP_LAYERS:
+                return False
+            key = prefix
+            following = INCHI_LAYERS[key][2]
+        chars, empty, _ = INCHI_LAYERS[key]
+        content = layer[1:]
+        if not (content or empty) or not chars.issuperset(content) or not _balanced(content):
+            return False
+    return True
+
+
+def _identifier_type(t):
+    """Return the type of chemical identifier in a whitespace-free token, or None.
+
+    Cheap checks on the length and characters of the token decide which validators are worth running.
+    """
+    if len(t) == 27 and t[14] == u'-' and t[25] == u'-' and INCHIKEY_RE.match(t):
+        return u'inchikey'
+    if t[0] in DIGITS and t[-2:-1] == u'-' and CAS_RE.match(t):
+        return u'cas'
+    if t[0] in u'Ii1' and u'/' in t and is_inchi(t):
+        return u'inchi'
+    if len(t) > 2 and not t.endswith(u'.') and is_smiles(t):
+        return u'smiles'
+    return None
+
+
+def extract_identifiers(s):
+    """Return a list of (type, identifier, start, end) tuples for the chemical identifiers in the string.
+
+    The type is one of 'inchi', 'inchikey', 'smiles' or 'cas', and start and end are the offsets of the identifier in
+    the string. The string is split on whitespace once, and each token is given the first type that it matches.
+    """
+    s = text.u(s)
+    identifiers = []
+    end = 0
+    for t in s.split():
+        start = s.find(t, end)
+        end = start + len(t)
+        identifier_type = _identifier_type(t)
+        if identifier_type:
+            identifiers.append((identifier_type, t, start, end))
+    return identifiers
 
 
 def extract_inchis(s):
     """Return a list of InChI identifiers extracted from the string."""
-    return [t for t in text.u(s).split() if INCHI_RE.match(t)]
+    return [t for t in text.u(s).split() if is_inchi(t)]
 
 
 def extract_inchikeys(s):
     """Return a list of InChIKey identifiers extracted from the string."""
-    return [t for t in text.u(s).split() if INCHIKEY_RE.match(t)]
+    return [t for t in text.u(s).split() if len(t) == 27 and INCHIKEY_RE.match(t)]
 
 
 def extract_smiles(s):
     """Return a list of SMILES identifiers extracted from the string."""
     # TODO: This still gets a lot of false positives.
-    smiles = []
-    for t in text.u(s).split():
-        if len(t) > 2 and SMILES_RE.match(t) and not t.endswith('.') and text.bracket_level(t) == 0:
-            smiles.append(t)
-    return smiles
+    return [t for t in text.u(s).split() if len(t) > 2 and not t.endswith('.') and is_smiles(t)]
 
 
 def extract_cas(s):
@@ -8,12 +8,69 @@ Chemistry-aware text tokenization.
 :copyright: Copyright 2014 by Matt Swain.
 :license: MIT, see LICENSE file for more details.
 """
-import os
+from collections import Counter, deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
 import re
 
 from lmtk import text, html, utils
 from .text import ELEMENTS, ELEMENT_SYMBOLS
 
+class SubtokenCache(object):
+    """A size-bounded cache of token splits that can be shared by ChemTokenizer instances.
+
+    Keys are tokens, paired with any next token context the split rules read, and values are (rule name, subtokens)
+    tuples. So that a lookup costs little more than the split it saves, entries are kept in two generations of plain
+    dicts rather than in strict least recently used order. When the current generation fills up it replaces the old
+    generation, and entries are moved from the old generation back to the current one when used, so at most
+    2 * maxsize entries are kept. Sharing a cache between threads is safe, although a race may lose an entry or count.
+    """
+
+    def __init__(self, maxsize=50000):
+        """Initialize with the number of entries to keep in each generation."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._current = {}
+        self._old = {}
+
+    def __len__(self):
+        return len(self._current) + len(self._old)
+
+    @property
+    def hit_rate(self):
+        """The fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def get(self, key):
+        """Return the value cached for key, or None if not cached."""
+        value = self._current.get(key)
+        if value is None:
+            value = self._old.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.set(key, value)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Cache the value for key, starting a new generation if the current one is full."""
+        self._old.pop(key, None)
+        if len(self._current) >= self.maxsize:
+            self._old = self._current
+            self._current = {}
+        self._current[key] = value
+
+    def clear(self):
+        """Remove all entries and reset the hit and miss counters."""
+        self._current = {}
+        self._old = {}
+        self.hits = 0
+        self.misses = 0
+
+
 class ChemTokenizer():
     """Chemistry-aware text tokenizer.
 
@@ -23,32 +80,85 @@ class ChemTokenizer():
     Centre for Molecular Science Informatics, University of Cambridge and released under the Artistic License 2.0. See
     https://bitbucket.org/wwmm/oscar4 for more information.
 
+    Token splits are cached in a SubtokenCache for each class that is shared by its instances, so repeated tokens are
+    only split once. Overriding any other attribute on an instance gives that instance a new cache of its own, so that it
+    never uses splits made with different word lists, patterns or rules. Set `cache` to None on a class before creating
+    instances or on an instance to disable caching, or to a new SubtokenCache to use a separate cache.
+
     """
 
-    def __init__(self):
-        # Set up parameters and compile regular expressions
-        self.oxstate = re.compile(r'(%s)\((o|i{1,4}|i{0,3}[xv]|[xv]i{0,4})\)$' % '|'.join(ELEMENTS | ELEMENT_SYMBOLS), re.I)
-        self.bracketrange = re.compile(r'^\((\w+)\)-\((\w+)\)$')
-        self.chemnamecolon = re.compile(ur"(η\d:η\d|"
-                                        ur"\d+[a-g]?[′']*(alpha|beta)?,\d[a-g]?[′']*(alpha|beta)?(-([a-zA-Z][′']*)+)?:\d|"
-                                        ur"\d[a-g]?[′']*(alpha|beta)?(-([a-zA-Z][′']*)+)?:\d[a-g]?[′']*(alpha|beta)?,\d)")
-        self.chemnameequals = re.compile(r'[^=]*[CNHOP]+[0-9]*[\(\)]?=\(?[CNOP].*')
-        self.quantity = re.compile(ur'^([∼~≈]?-?(?![12]s)\d+(?:\.\d+)?|\d*\.\d+)([cdGkmMnpTuµ]?'
-                                   ur'(?:[gJlLMmNsVW]|[Gg]ramm?e?s?|Hz|[Mm][Oo][Ll](?:e|ar)?s?|h?Pa|ppm)(?:-?\d)?)$')
-        self.percentage = re.compile(ur'^(-?\d+(?:\.\d+)?|\d*\.\d+)(%)$')
-        self.ph = re.compile(ur'^(ph)(-?\d+(?:\.\d+)?|\d*\.\d+)$', re.I)
-        self.temperature = re.compile(ur'^([∼~≈]?-?\d+(?:\.\d+)?|\d*\.\d+)?([°º])([cf])?$', re.I)
-        self.initial = re.compile(ur'^(-?[A-Zv]\.)+$')
-        self.linesymbol = re.compile(ur'^([\-–—−*+\.=_~×…·■●▲○◆▼△◇▽⬚]+)$')
-        self.chemafterinitial = re.compile(r'^[a-z]+?(o[blnrs]a|i[cdlnv]a|o[lr]i|a[nt]a|[ae]ns|u[ms]|i[ais]|ae|e(ll)?a|et?i|u[cls]?a)$')
+    @utils.per_class_property
+    def cache(cls):
+        return SubtokenCache()
+
+    # Word lists and regular expressions are built on first use and then shared by all instances
+
+    @utils.shared_property
+    def oxstate(cls):
+        elements = text.trie_pattern(ELEMENTS | ELEMENT_SYMBOLS, ignorecase=True)
+        return re.compile(r'(%s)\((o|i{1,4}|i{0,3}[xv]|[xv]i{0,4})\)$' % elements, re.I)
+
+    @utils.shared_property
+    def bracketrange(cls):
+        return re.compile(r'^\((\w+)\)-\((\w+)\)$')
+
+    @utils.shared_property
+    def chemnamecolon(cls):
+        return re.compile(ur"(η\d:η\d|"
+                          ur"\d+[a-g]?[′']*(alpha|beta)?,\d[a-g]?[′']*(alpha|beta)?(-([a-zA-Z][′']*)+)?:\d|"
+                          ur"\d[a-g]?[′']*(alpha|beta)?(-([a-zA-Z][′']*)+)?:\d[a-g]?[′']*(alpha|beta)?,\d)")
+
+    @utils.shared_property
+    def chemnameequals(cls):
+        return re.compile(r'[^=]*[CNHOP]+[0-9]*[\(\)]?=\(?[CNOP].*')
+
+    @utils.shared_property
+    def quantity(cls):
+        return re.compile(ur'^([∼~≈]?-?(?![12]s)\d+(?:\.\d+)?|\d*\.\d+)([cdGkmMnpTuµ]?'
+                          ur'(?:[gJlLMmNsVW]|[Gg]ramm?e?s?|Hz|[Mm][Oo][Ll](?:e|ar)?s?|h?Pa|ppm)(?:-?\d)?)$')
+
+    @utils.shared_property
+    def percentage(cls):
+        return re.compile(ur'^(-?\d+(?:\.\d+)?|\d*\.\d+)(%)$')
+
+    @utils.shared_property
+    def ph(cls):
+        return re.compile(ur'^(ph)(-?\d+(?:\.\d+)?|\d*\.\d+)$', re.I)
+
+    @utils.shared_property
+    def temperature(cls):
+        return re.compile(ur'^([∼~≈]?-?\d+(?:\.\d+)?|\d*\.\d+)?([°º])([cf])?$', re.I)
+
+    @utils.shared_property
+    def initial(cls):
+        return re.compile(ur'^(-?[A-Zv]\.)+$')
+
+    @utils.shared_property
+    def linesymbol(cls):
+        return re.compile(ur'^([\-–—−*+\.=_~×…·■●▲○◆▼△◇▽⬚]+)$')
+
+    @utils.shared_property
+    def chemafterinitial(cls):
+        return re.compile(r'^[a-z]+?(o[blnrs]a|i[cdlnv]a|o[lr]i|a[nt]a|[ae]ns|u[ms]|i[ais]|ae|e(ll)?a|et?i|u[cls]?a)$')
+
+    @utils.shared_property
+    def propernounhyphen(cls):
         propernoun = ur"(O'|Ma?c)?[A-Z][a-z]{3,}(s'|'s)?"
-        self.propernounhyphen = re.compile(ur"(%s(%s))+%s" % (propernoun, '|'.join(text.HYPHENS), propernoun), re.U)
-        self.concfollowing = {'=', '/', u'≈', u'≥', u'≤', u'>', u'<'}
-        with open(utils.find_data(os.path.join('words', 'lastnames.txt')), 'r') as f:
-            self.lastnames = {name.strip() for name in f}
-        with open(utils.find_data(os.path.join('words', 'hyphen_splits.txt')), 'r') as f:
-            self.hyphensplits = {word.lower().strip() for word in f}
-        self.abbreviations = {
+        return re.compile(ur"(%s(%s))+%s" % (propernoun, '|'.join(text.HYPHENS), propernoun), re.U)
+
+    concfollowing = frozenset({'=', '/', u'≈', u'≥', u'≤', u'>', u'<'})
+
+    @utils.shared_property
+    def lastnames(cls):
+        return utils.word_list('lastnames')
+
+    @utils.shared_property
+    def hyphensplits(cls):
+        return utils.word_list('hyphen_splits', lower=True)
+
+    @utils.shared_property
+    def abbreviations(cls):
+        return frozenset({
             '+vs.', '.e.g.', '1vs.', '24h.', '2vs.', '3vs.', '4vs.', '5vs.', '6vs.', '7vs.', '8vs.', '9vs.', 'abs.',
             'acad.', 'acc.', 'adm.', 'adv.', 'agric.', 'al.', 'ala.', 'allg.', 'am.', 'ampl.', 'anal.', 'angew.',
             'anh.', 'anorg.', 'appl.', 'approx.', 'apr.', 'aq.', 'ariz.', 'atmos.', 'aug.', 'aut.', 'av.', 'ave.',
@@ -72,8 +182,11 @@ class ChemTokenizer():
             'univ.', 'v1.', 'v2.', 'vel.', 'viz.', 'vol.', 'vs.', 'vs.i.', 'vs.n.', 'vvs.', 'wed.', 'wt.', 'xmp.',
             'xvs.', 'yr.', 'zvs.', u'±s.d.', u'Λvs.', u'Δεvs.', u'ηvs.', u'φfvs.', u'χmtvs.', u'χmvs.', u'νs.',
             u'λexc.', u'λmax.', u'σvs.'
-        }
-        self.collocs = {
+        })
+
+    @utils.shared_property
+    def collocs(cls):
+        return frozenset({
             ('a', 'commune'), ('a', 'niger'), ('c', 'limon'), ('d', 'bardawil'), ('e', 'antonini'), ('e', 'coli'),
             ('e', 'colia'), ('j', 'adv'), ('j', 'agric'), ('j', 'am'), ('j', 'anal'), ('j', 'appl'), ('j', 'biol'),
             ('j', 'biomed'), ('j', 'catal'), ('j', 'chem'), ('j', 'cheminf'), ('j', 'chromatogr'), ('j', 'comb'),
@@ -82,8 +195,15 @@ class ChemTokenizer():
             ('j', 'struct'), ('l', 'extract'), ('l', 'mesenteroides'), ('m', '1.5'), ('mol', 'biol'), ('mol', 'struct'),
             ('n', 'crassa'), ('p', 'bursaria'), ('p', 'simplex'), ('p', 'ulysses'), ('p', u'νersutus'),
             ('s', 'cattleya'), ('s', 'coelicolor'), ('t', 'maritima')
-        }
-        self.nosplitprefix = {
+        })
+
+    @utils.shared_property
+    def collocafter(cls):
+        return frozenset(after for _, after in cls.collocs)
+
+    @utils.shared_property
+    def nosplitprefix(cls):
+        return frozenset({
             '.*ano', '.*ato', '.*azo', '.*boc', '.*bromo', '.*cbz', '.*chloro', '.*eno', '.*fluoro', '.*fmoc', '.*ido',
             '.*ino', '.*io', '.*iodo', '.*mercapto', '.*nitro', '.*ono', '.*oso', '.*oxalo', '.*oxo', '.*oxy',
             '.*phospho', '.*telluro', '.*tms', '.*yl', '.*ylen', '.*ylene', '.*yliden', '.*ylidene', '.*ylidyn',
@@ -103,8 +223,11 @@ class ChemTokenizer():
             'tau', 'tele', 'ter', 'tera', 'tert', 'tetra', 'theta', 'threo', 'trans', 'tri', 'triangulo', 'tris',
             'uber', 'ultra', 'un', 'uni', 'unsym', 'upsilon', 'veno', 'ventriculo', 'xi', 'xylo', 'zeta',
             u'\d[`′\']?(,\d\[`′\']?(,\d\[`′\']?)?)?'
-        }
-        self.split = {
+        })
+
+    @utils.shared_property
+    def split(cls):
+        return frozenset({
             'absorption', 'acid', 'active', 'addition', 'adsorption', 'air', 'alkaline', 'all', 'analogous', 'angle',
             'area', 'armed', 'atom', 'atomic', 'average', 'band', 'bandwidth', 'based', 'binding', 'bioactivity',
             'biomonitor', 'black', 'blood', 'blue', 'bond', 'bonds', 'bottom', 'bound', 'bridged', 'broad', 'built',
@@ -138,162 +261,245 @@ class ChemTokenizer():
             # addition armed bridged caged capped catalysed catalyzed cored derivatised derivatized derived expanded
             # extraction function functionalised functionalized grafted lined linked mediated migrated pillared
             # protected reaction rearranged tethered transition
-        }
-        self.nosplitprefixre = re.compile(r'(\b|[0-9])(%s)(-n)?$' % '|'.join(self.nosplitprefix), re.I)
-        self.splitprefixre = re.compile(ur'^(%s)$' % '|'.join(self.split), re.I)
-        self.splitsuffixre = re.compile(ur'^(un|de|re|pre)?(%s)s?$' % '|'.join(self.split), re.I)
+        })
 
-    def _hyphensplit(self, token):
-        """Split token on hyphen according to rules."""
-        # Iterate characters from end of string, ensuring at least 1 char before and 2 char after hyphen
-        for i, c in enumerate(reversed(token[1:-2])):
-            if c in text.HYPHENS:
-                before = token[:-3-i]
-                after = token[-2-i:]
-                # Don't split on hyphens enclosed within brackets
-                if text.bracket_level(token) == 0 and not text.bracket_level(after) == 0:
-                    continue
-                # Split on double-dashes
-                if before[-1] in text.HYPHENS:
-                    return [before[:-1], before[-1] + c, after]
-                # Split on "-to-" "-in-" "-by-" "-of-"
-                if len(before) > 2 and before[-3] in text.HYPHENS and before[-2:] in {'to', 'in', 'by', 'of'}:
-                    return [before[:-3], before[-3], before[-2:], c, after]
-                # Split on "-and-", "-per-"
-                if len(before) > 3 and before[-4] in text.HYPHENS and before[-3:] in {'and', 'per'}:
-                    return [before[:-4], before[-4], 'and', c, after]
-                # Don't split if before matches self.nosplitprefixre or if token is in self.hyphensplits
-                if self.nosplitprefixre.search(before) or token in self.hyphensplits or (after[0] == 'd' and
-                                                                                         after[1].isdigit()):
-                    continue
-                # Split if after matches self.splitsuffixre or split token is in self.hyphensplits
-                if (self.splitsuffixre.match(after) or self.splitprefixre.match(before) or
-                        '%s %s' % (before, after) in self.hyphensplits):
-                    return [before, c, after]
-                # Split if token is hyphenated proper noun or
-                if self.propernounhyphen.match(token) or (after.isalpha() and
-                                                          (after.endswith('ing') or after.endswith('ed'))):
-                    return [before, c, after]
+    @utils.shared_property
+    def inlineopen(cls):
+        return re.compile(r'<(%s)>' % '|'.join(html.INLINE_ELEMENTS))
 
-    def _subtokenize(self, token, nexttoken):
-        """Split token into subtokens according to rules, using the token and next token if it exists."""
-        if len(token) <= 1 or token.lower() in self.abbreviations or self.linesymbol.match(token):
-            return
-        first = token[0]
-        last = token[-1]
+    @utils.shared_property
+    def inlineclose(cls):
+        return re.compile(r'</(%s)>' % '|'.join(html.INLINE_ELEMENTS))
+
+    @utils.shared_property
+    def nosplitprefixre(cls):
+        # Most prefixes are words, but some are patterns. Those that are '.*' followed by a word share a single '.*'
+        words, endings, patterns = [], [], []
+        for prefix in cls.nosplitprefix:
+            if prefix.isalpha():
+                words.append(prefix)
+            elif prefix.startswith('.*') and prefix[2:].isalpha():
+                endings.append(prefix[2:])
+            else:
+                patterns.append(prefix)
+        prefixes = [text.trie_pattern(words, ignorecase=True), '.*%s' % text.trie_pattern(endings, ignorecase=True)]
+        return re.compile(r'(\b|[0-9])(%s)(-n)?$' % '|'.join(prefixes + patterns), re.I)
+
+    @utils.shared_property
+    def splitprefixre(cls):
+        return re.compile(ur'^(%s)$' % text.trie_pattern(cls.split, ignorecase=True), re.I)
+
+    @utils.shared_property
+    def splitsuffixre(cls):
+        return re.compile(ur'^(un|de|re|pre)?(%s)s?$' % text.trie_pattern(cls.split, ignorecase=True), re.I)
+
+    @utils.shared_property
+    def inlinetag(cls):
+        return re.compile(r'</?(%s)>' % '|'.join(html.INLINE_ELEMENTS))
+
+    @utils.shared_property
+    def inlinetagend(cls):
+        return re.compile(r'</?(%s)>$' % '|'.join(html.INLINE_ELEMENTS))
+
+    @utils.shared_property
+    def abbreviationdot(cls):
+        return re.compile(r'[a-z]\.[a-z]', re.I)
+
+    @utils.shared_property
+    def capital(cls):
+        return re.compile(r'^[A-Z]$')
+
+    @utils.shared_property
+    def splitchars(cls):
+        return re.compile(ur'[<>/×÷⋯]')
+
+    leading = frozenset(text.QUOTES | {u'≡', u'≠', u'≣', u'≢', u'≥', u'≤', u'≧', u'≦', u'≩', u'≨', u'≫', u'≪', u'=', u'>'})
+    trailing = frozenset(text.QUOTES | {',', ';', ':', '!', '?', '=', u'™', u'÷', u'®', u'×', u'…'})
+    conjunctions = frozenset({'and', 'or', '/', ','})
+    endings = ('(TM)', '(R)', '((TM))', '((R))', '...')
+    stateendings = ('(aq)', '(aq.)', '(s)', '(l)', '(g)')
+    linesymbolendings = (u'(■)', u'(●)', u'(▲)', u'(○)', u'(◆)', u'(▼)', u'(△)', u'(◇)', u'(▽)', u'(⬚)', u'(×)', u'(□)',
+                         u'(•)')
+    numberabbreviations = frozenset({'no.', 'p.', 'pp.'})
+    hyphenwords2 = frozenset({'to', 'in', 'by', 'of'})
+    hyphenwords3 = frozenset({'and', 'per'})
+
+    # Rules for splitting a token, in the order they are tried: (name, method, extra arguments, first characters, last
+    # characters, contained characters). A rule is only tried on tokens that start with one of its first characters, end
+    # with one of its last characters and contain one of its contained characters, where None means any token.
+    rules = (
+        ('bracketrange', '_split_bracketrange', (), '(', ')', '-'),
+        ('openparen', '_split_open', ('(', ')'), '(', None, None),
+        ('closeparen', '_split_close', ('(', ')'), None, ')', None),
+        ('opensquare', '_split_open', ('[', ']'), '[', None, None),
+        ('closesquare', '_split_close', ('[', ']'), None, ']', None),
+        ('opencurly', '_split_open', ('{', '}'), '{', None, None),
+        ('closecurly', '_split_close', ('{', '}'), None, '}', None),
+        ('leading', '_split_first', (), leading, None, None),
+        ('trailing', '_split_last', (), None, trailing, None),
+        ('hyphenconjunction', '_split_hyphen_conjunction', (), None, '-', None),
+        ('ending', '_split_ending', (endings,), None, ').', None),
+        ('stateending', '_split_state_ending', (), None, ')', None),
+        ('linesymbolending', '_split_ending', (linesymbolendings,), None, ')', None),
+        ('fullstop', '_split_fullstop', (), None, '.', None),
+        ('quantity', '_split_groups', ('quantity',), None, None, None),
+        ('percentage', '_split_groups', ('percentage',), None, '%', None),
+        ('ph', '_split_groups', ('ph',), 'pP', None, None),
+        ('temperature', '_split_groups', ('temperature',), None, None, u'°º'),
+        ('splitchar', '_split_char', (), None, None, u'<>/×÷⋯'),
+        ('plus', '_split_plus', (), None, None, '+'),
+        ('colon', '_split_colon', (), None, None, ':'),
+        ('equals', '_split_equals', (), None, None, '='),
+        ('hyphen', '_split_hyphen', (), None, None, text.HYPHENS),
+    )
+
+    # The rules and their lookup tables are derived from `rules` and the split methods, which a subclass may override
+
+    @utils.per_class_property
+    def _rules(cls):
+        """The rules with each filter as a frozenset of characters and each method looked up on the class."""
+        return tuple((name, getattr(cls, method), args, first and frozenset(first), last and frozenset(last),
+                      contains and frozenset(contains)) for name, method, args, first, last, contains in cls.rules)
+
+    @utils.per_class_property
+    def _contained(cls):
+        """A regular expression that finds every character used by a rule contains filter."""
+        chars = set()
+        for rule in cls._rules:
+            chars |= rule[5] or set()
+        return re.compile(ur'[%s]' % ''.join(re.escape(c) for c in sorted(chars)))
+
+    @utils.per_class_property
+    def _dispatch(cls):
+        """The rules that pass the first and last character filters for each (first, last) pair seen so far."""
+        return {}
+
+    _dispatch_size = 100000
+
+    def __init__(self):
+        # Look up the cache for the class once, rather than for every token
+        self.__dict__['cache'] = self.__class__.cache
+        #: The number of tokens split by each rule, for tuning the rules
+        self.rule_hits = Counter()
+
+    def __setattr__(self, name, value):
+        # The cached splits may depend on the attribute being overridden, so start a new cache for this instance
+        if name not in {'cache', 'rule_hits'} and self.cache is not None:
+            self.__dict__['cache'] = SubtokenCache()
+        self.__dict__[name] = value
 
-        # Split (\w+)-(\w+) to ( \w+ ) - ( \w+ )
+    def _split_bracketrange(self, token, nexttoken):
+        """Split bracketed ranges like '(a)-(b)' to '( a ) - ( b )'."""
         modtoken = self.bracketrange.sub(r'( \1 ) - ( \2 )', token)
         if not modtoken == token:
             return modtoken.split()
 
-        # Split off open or close bracket off start or end under certain conditions
-        for brp in [('(', ')'), ('[', ']'), ('{', '}')]:
-            if first == brp[0]:
-                bc = 1
-                ci = 0
-                for i, c in enumerate(token[1:]):
-                    bc = bc+1 if c == brp[0] else bc
-                    bc = bc-1 if c == brp[1] else bc
-                    if bc == 0:
-                        ci = i + 1
-                        break
-                if ci == 0:
-                    return [first, token[1:]]
-                elif ci == len(token) - 1 and (not last == ']' or (len(token) < 4 or
-                                                                   (nexttoken and nexttoken in self.concfollowing) or
-                                                                   token[1:-1].isupper() or token[1:-1].islower())):
-                    return [first, token[1:]]
-            if last == brp[1] and not self.oxstate.search(token):
-                bc = 1
-                ci = 0
-                for i, c in enumerate(reversed(token[:-1])):
-                    bc = bc+1 if c == brp[1] else bc
-                    bc = bc-1 if c == brp[0] else bc
-                    if bc == 0:
-                        ci = i + 1
-                        break
-                if ci == 0:
-                    return [token[:-1], last]
-                elif ci == len(token) - 1 and (not last == ']' or (len(token) < 4 or
-                                                                   (nexttoken and nexttoken in self.concfollowing) or
-                                                                   token[1:-1].isupper() or token[1:-1].islower())):
-                    return [token[:-1], last]
-
-        # Split specific characters off start and end
-        if first in text.QUOTES | {u'≡', u'≠', u'≣', u'≢', u'≥', u'≤', u'≧', u'≦', u'≩', u'≨', u'≫', u'≪', u'=', u'>'}:
-            return [first, token[1:]]
-        if last in text.QUOTES | {',', ';', ':', '!', '?', '=', u'™', u'÷', u'®', u'×', u'…'}:
-            return [token[:-1], last]
-        if last == '-' and nexttoken in {'and', 'or', '/', ','} and token[:-1].isalpha() and (
+    def _split_open(self, token, nexttoken, open, close):
+        """Split open bracket off start under certain conditions."""
+        bc = 1
+        ci = 0
+        for i, c in enumerate(token[1:]):
+            bc = bc+1 if c == open else bc
+            bc = bc-1 if c == close else bc
+            if bc == 0:
+                ci = i + 1
+                break
+        if ci == 0:
+            return [token[0], token[1:]]
+        elif ci == len(token) - 1 and (not token[-1] == ']' or (len(token) < 4 or
+                                                                (nexttoken and nexttoken in self.concfollowing) or
+                                                                token[1:-1].isupper() or token[1:-1].islower())):
+            return [token[0], token[1:]]
+
+    def _split_close(self, token, nexttoken, open, close):
+        """Split close bracket off end under certain conditions."""
+        if self.oxstate.search(token):
+            return
+        bc = 1
+        ci = 0
+        for i, c in enumerate(reversed(token[:-1])):
+            bc = bc+1 if c == close else bc
+            bc = bc-1 if c == open else bc
+            if bc == 0:
+                ci = i + 1
+                break
+        if ci == 0:
+            return [token[:-1], token[-1]]
+        elif ci == len(token) - 1 and (not token[-1] == ']' or (len(token) < 4 or
+                                                                (nexttoken and nexttoken in self.concfollowing) or
+                                                                token[1:-1].isupper() or token[1:-1].islower())):
+            return [token[:-1], token[-1]]
+
+    def _split_first(self, token, nexttoken):
+        """Split specific characters off start."""
+        return [token[0], token[1:]]
+
+    def _split_last(self, token, nexttoken):
+        """Split specific characters off end."""
+        return [token[:-1], token[-1]]
+
+    def _split_hyphen_conjunction(self, token, nexttoken):
+        """Split hyphen off end of a word before a conjunction, e.g. 'mono- and di-substituted'."""
+        if nexttoken in self.conjunctions and token[:-1].isalpha() and (
                 token[:-1].islower() or (len(token) > 3 and token[0].isupper() and token[1:-1].islower())):
-            return [token[:-1], last]
+            return [token[:-1], token[-1]]
 
-        # Split off multiple character endings
-        for ending in ['(TM)', '(R)', '((TM))', '((R))', '...']:
+    def _split_ending(self, token, nexttoken, endings):
+        """Split off multiple character endings."""
+        for ending in endings:
             if token.endswith(ending) and len(ending) < len(token):
                 return [token.rsplit(ending, 1)[0], ending]
 
-        # Split off state endings, unless preceded by a digit
-        for ending in ['(aq)', '(aq.)', '(s)', '(l)', '(g)']:
+    def _split_state_ending(self, token, nexttoken):
+        """Split off state endings, unless preceded by a digit."""
+        for ending in self.stateendings:
             if token.endswith(ending) and len(token) > len(ending):
                 pre = token.rsplit(ending, 1)[0]
                 if not pre.isdigit():
                     return [pre, ending]
 
-        # Split off line symbol endings
-        for ending in [u'(■)', u'(●)', u'(▲)', u'(○)', u'(◆)', u'(▼)', u'(△)', u'(◇)', u'(▽)', u'(⬚)', u'(×)', u'(□)', u'(•)']:
-            if token.endswith(ending) and len(ending) < len(token):
-                return [token.rsplit(ending, 1)[0], ending]
+    def _split_fullstop(self, token, nexttoken):
+        """Split full stop off end under certain conditions."""
+        if not nexttoken:
+            return [token[:-1], token[-1]]
+        before = token.rstrip('\'"-=<>/,.:;!?')
+        after = text.unapostrophe(nexttoken.rstrip('\'"-=<>/,.:;!?)]}'))
+        if not (self.abbreviationdot.match(before) or
+                (before.lower(), after.lower()) in self.collocs or
+                (token.lower() in self.numberabbreviations and after.isdigit()) or
+                (self.capital.match(before) and self.chemafterinitial.match(after)) or
+                (self.initial.match(token) and (self.initial.match(nexttoken) or
+                                                after.lower() in text.NAME_SMALL or
+                                                after in self.lastnames))):
+            return [token[:-1], token[-1]]
 
-        # Split full stop off end under certain conditions
-        if last == '.':
-            if not nexttoken:
-                return [token[:-1], last]
-            before = token.rstrip('\'"-=<>/,.:;!?')
-            after = text.unapostrophe(nexttoken.rstrip('\'"-=<>/,.:;!?)]}'))
-            if not (re.match(r'[a-z]\.[a-z]', before, re.I) or
-                    (before.lower(), after.lower()) in self.collocs or
-                    (token.lower() in {'no.', 'p.', 'pp.'} and after.isdigit()) or
-                    (re.match(r'^[A-Z]$', before) and self.chemafterinitial.match(after)) or
-                    (self.initial.match(token) and (self.initial.match(nexttoken) or
-                                                    after.lower() in text.NAME_SMALL or
-                                                    after in self.lastnames))):
-                return [token[:-1], last]
-
-        # Quantities
-        m = self.quantity.match(token)
-        if m:
-            return m.groups()
-        m = self.percentage.match(token)
-        if m:
-            return m.groups()
-        m = self.ph.match(token)
-        if m:
-            return m.groups()
-        m = self.temperature.match(token)
+    def _split_groups(self, token, nexttoken, regex):
+        """Split quantities into the non-empty groups of a regular expression."""
+        m = getattr(self, regex).match(token)
         if m:
             return [g for g in m.groups() if g]
 
-        # Characters to split on, with a set of exceptions for each character
-        for i, c in enumerate(token):
-            if c in ['<', '>', '/', u'×', u'÷', u'⋯']:
-                if c == '<':
-                    # Don't plit on '<' if part of HTML tag
-                    if re.match(r'</?(%s)>' % '|'.join(html.INLINE_ELEMENTS), token[i:]):
-                        continue
-                elif c == '>':
-                    # Don't split on '>' if an arrow like '->' or part of HTML tag
-                    if (re.search(r'</?(%s)>$' % '|'.join(html.INLINE_ELEMENTS), token[:i+1]) or
-                            (i > 2 and token[i-1] == '-' and not token[i-2] == '>')):
-                        continue
-                elif c == '/':
-                    # Don't split on / if part of HTML tag or URL
-                    if re.match(r'</(%s)>' % '|'.join(html.INLINE_ELEMENTS), token[i-1:]) or token.startswith('http'):
-                        continue
-                return [token[:i], token[i:i+1], token[i+1:]]
+    def _split_char(self, token, nexttoken):
+        """Split on certain characters, with a set of exceptions for each character."""
+        for m in self.splitchars.finditer(token):
+            i = m.start()
+            c = token[i]
+            if c == '<':
+                # Don't plit on '<' if part of HTML tag
+                if self.inlinetag.match(token, i):
+                    continue
+            elif c == '>':
+                # Don't split on '>' if an arrow like '->' or part of HTML tag
+                if self.inlinetagend.search(token, 0, i+1) or (i > 2 and token[i-1] == '-' and not token[i-2] == '>'):
+                    continue
+            elif c == '/':
+                # Don't split on / if part of HTML tag or URL
+                if (i > 0 and self.inlineclose.match(token, i-1)) or token.startswith('http'):
+                    continue
+            return [token[:i], token[i:i+1], token[i+1:]]
 
-        # Split on '+' under certain conditions
+    def _split_plus(self, token, nexttoken):
+        """Split on '+' under certain conditions."""
         for i, c in enumerate(token):
             if c == '+':
                 if i < len(token) - 2 and token[i+1] in text.HYPHENS:
@@ -309,40 +515,192 @@ class ChemTokenizer():
                     continue
                 return [token[:i], token[i:i+1], token[i+1:]]
 
-        # Split on ':' unless in a chemical name like 2,2':6',2''-Terphenyl-1,1',1''-triol or in URL
-        if ':' in token and not self.chemnamecolon.search(token) and not token.startswith('http'):
+    def _split_colon(self, token, nexttoken):
+        """Split on ':' unless in a chemical name like 2,2':6',2''-Terphenyl-1,1',1''-triol or in URL."""
+        if not self.chemnamecolon.search(token) and not token.startswith('http'):
             return list(token.partition(':'))
 
-        # Split on '=' unless in a chemical name like CH2=CH2
-        if '=' in token and not self.chemnameequals.search(token):
+    def _split_equals(self, token, nexttoken):
+        """Split on '=' unless in a chemical name like CH2=CH2."""
+        if not self.chemnameequals.search(token):
             return list(token.partition('='))
 
-        # Split on '-' under certain conditions
-        hsplit = self._hyphensplit(token)
-        if hsplit:
-            return hsplit
+    def _split_hyphen(self, token, nexttoken):
+        """Split token on hyphen according to rules."""
+        balanced = None
+        # Iterate characters from end of string, ensuring at least 1 char before and 2 char after hyphen
+        for i, c in enumerate(reversed(token[1:-2])):
+            if c in text.HYPHENS:
+                before = token[:-3-i]
+                after = token[-2-i:]
+                # Don't split on hyphens enclosed within brackets
+                if balanced is None:
+                    balanced = text.bracket_level(token) == 0
+                if balanced and not text.bracket_level(after) == 0:
+                    continue
+                # Split on double-dashes
+                if before[-1] in text.HYPHENS:
+                    return [before[:-1], before[-1] + c, after]
+                # Split on "-to-" "-in-" "-by-" "-of-"
+                if len(before) > 2 and before[-3] in text.HYPHENS and before[-2:] in self.hyphenwords2:
+                    return [before[:-3], before[-3], before[-2:], c, after]
+                # Split on "-and-", "-per-"
+                if len(before) > 3 and before[-4] in text.HYPHENS and before[-3:] in self.hyphenwords3:
+                    return [before[:-4], before[-4], 'and', c, after]
+                # Don't split if before matches self.nosplitprefixre or if token is in self.hyphensplits
+                if self.nosplitprefixre.search(before) or token in self.hyphensplits or (after[0] == 'd' and
+                                                                                         after[1].isdigit()):
+                    continue
+                # Split if after matches self.splitsuffixre or split token is in self.hyphensplits
+                if (self.splitsuffixre.match(after) or self.splitprefixre.match(before) or
+                        '%s %s' % (before, after) in self.hyphensplits):
+                    return [before, c, after]
+                # Split if token is hyphenated proper noun or
+                if self.propernounhyphen.match(token) or (after.isalpha() and
+                                                          (after.endswith('ing') or after.endswith('ed'))):
+                    return [before, c, after]
 
-    def tokenize(self, s):
-        """Tokenize a string."""
+    def _split(self, token, nexttoken):
+        """Return the name of the first rule that splits token and the subtokens, or (None, None) if no rule applies."""
+        if token.lower() in self.abbreviations or self.linesymbol.match(token):
+            return None, None
+        key = (token[0], token[-1])
+        rules = self._dispatch.get(key)
+        if rules is None:
+            if len(self._dispatch) >= self._dispatch_size:
+                self._dispatch.clear()
+            rules = tuple(rule for rule in self._rules if (rule[3] is None or key[0] in rule[3]) and
+                          (rule[4] is None or key[1] in rule[4]))
+            self._dispatch[key] = rules
+        contained = None
+        for name, split, args, _, _, contains in rules:
+            if contains is not None:
+                if contained is None:
+                    contained = set(self._contained.findall(token))
+                if contains.isdisjoint(contained):
+                    continue
+            subtokens = split(self, token, nexttoken, *args)
+            if subtokens:
+                return name, tuple(subtokens)
+        return None, None
+
+    def _context(self, token, nexttoken):
+        """Return the parts of the next token that the rules read when splitting token, or None if they read none."""
+        last = token[-1]
+        if last == ']':
+            return bool(nexttoken and nexttoken in self.concfollowing)
+        if last == '-':
+            return nexttoken in self.conjunctions
+        if last == '.':
+            if not nexttoken:
+                return ()
+            after = text.unapostrophe(nexttoken.rstrip('\'"-=<>/,.:;!?)]}'))
+            lower = after.lower()
+            return (lower if lower in self.collocafter else None, after.isdigit(),
+                    bool(self.chemafterinitial.match(after)), bool(self.initial.match(nexttoken)),
+                    lower in text.NAME_SMALL, after in self.lastnames)
+
+    def _subtokenize(self, token, nexttoken):
+        """Split token into subtokens according to rules, using the token and next token if it exists."""
+        if len(token) <= 1:
+            return
+        cache = self.cache
+        if cache is None:
+            name, subtokens = self._split(token, nexttoken)
+        else:
+            context = self._context(token, nexttoken)
+            key = token if context is None else (token, context)
+            result = cache.get(key)
+            if result is None:
+                result = self._split(token, nexttoken)
+                cache.set(key, result)
+            name, subtokens = result
+        if name is not None:
+            self.rule_hits[name] += 1
+        return subtokens
+
+    def _inline_runs(self, words):
+        """Return (start, end) index ranges of words, where each run of words that make up an inline HTML element is a
+        single range."""
+        # For each word, find the earliest word it must be merged back to. This is the nearest preceding word with the
+        # opening tag for each closing tag the word contains. The first word never starts a merge.
+        starts = []
+        lastopen = {}
+        for i, word in enumerate(words):
+            start = i
+            if i > 0 and '<' in word:
+                for tag in self.inlineopen.findall(word):
+                    lastopen[tag] = i
+                for tag in self.inlineclose.findall(word):
+                    start = min(start, lastopen.get(tag, i))
+            starts.append(start)
+        # Working backwards, extend each merge to cover the starts of all the words it contains
+        runs = []
+        i = len(words) - 1
+        while i >= 0:
+            start = starts[i]
+            j = i
+            while j > start:
+                j -= 1
+                start = min(start, starts[j])
+            runs.append((start, i + 1))
+            i = start - 1
+        runs.reverse()
+        return runs
+
+    def _tokenize(self, s):
+        """Return a list of (token, start, end, offsets) tuples for the tokens in s.
+
+        Start and end are character offsets of the token in s. Offsets is None if the token is a contiguous slice of s,
+        otherwise it is a list of the offset in s of each character in the token (for merged inline HTML elements, which
+        may span any whitespace).
+        """
         # Split on whitespace, but preserve certain HTML tags as a single token (e.g. '<a>ref. 1</a>')
-        tokens = s.split()
-        for tag in html.INLINE_ELEMENTS:
-            for i in range(len(tokens)-1, 0, -1):
-                if '</%s>' % tag in tokens[i]:
-                    for j in range(i, 0, -1):
-                        if '<%s>' % tag in tokens[j]:
-                            tokens[j:i+1] = [' '.join(tokens[j:i+1])]
-                            break
-        # Recursively split tokens
-        i = 0
-        while i < len(tokens):
-            subtokens = self._subtokenize(tokens[i], tokens[i+1] if i+1 < len(tokens) else None)
+        words = s.split()
+        starts = []
+        pos = 0
+        for word in words:
+            pos = s.find(word, pos)
+            starts.append(pos)
+            pos += len(word)
+        pending = []
+        for first, last in reversed(self._inline_runs(words)):
+            start, end = starts[first], starts[last-1] + len(words[last-1])
+            if last - first == 1:
+                pending.append((words[first], start, end, None))
+                continue
+            token = ' '.join(words[first:last])
+            offsets = None
+            if s[start:end] != token:
+                offsets = []
+                for i in range(first, last):
+                    if i > first:
+                        offsets.append(starts[i-1] + len(words[i-1]))
+                    offsets.extend(range(starts[i], starts[i] + len(words[i])))
+            pending.append((token, start, end, offsets))
+        # Recursively split tokens, using a stack of pending tokens so each split takes constant time. Subtokens always
+        # partition their token, so their offsets follow from their lengths.
+        tokens = []
+        while pending:
+            token, start, end, offsets = pending.pop()
+            subtokens = self._subtokenize(token, pending[-1][0] if pending else None)
             if not subtokens:
-                i += 1
-            else:
-                tokens[i:i+1] = subtokens
-        tokens = [t for t in tokens if len(t) > 0]
-        # Group tokens into sentences
+                if token:
+                    tokens.append((token, start, end, offsets))
+                continue
+            i = len(token)
+            for subtoken in reversed(subtokens):
+                j = i - len(subtoken)
+                if offsets is None:
+                    pending.append((subtoken, start + j, start + i, None))
+                else:
+                    substart = offsets[j] if j < len(offsets) else end
+                    pending.append((subtoken, substart, offsets[i-1] + 1 if i > j else substart, offsets[j:i]))
+                i = j
+        return tokens
+
+    def _sentences(self, tokens):
+        """Return (start, end) index ranges of tokens for each sentence."""
         stops = []
         for i, x in enumerate(tokens):
             if x in {'.', '?', '!'}:
@@ -350,8 +708,57 @@ class ChemTokenizer():
                     stops.append(i + 2)
                 else:
                     stops.append(i + 1)
-        sentences = [tokens[i:j] for i, j in zip([0] + stops, stops + [len(tokens)]) if i < j]
-        return sentences
+        return [(i, j) for i, j in zip([0] + stops, stops + [len(tokens)]) if i < j]
+
+    def tokenize(self, s):
+        """Tokenize a string."""
+        tokens = [token for token, _, _, _ in self._tokenize(s)]
+        return [tokens[i:j] for i, j in self._sentences(tokens)]
+
+    def span_tokenize(self, s):
+        """Tokenize a string into (start, end) character offsets in s rather than token strings.
+
+        Sentences are grouped in the same way as `tokenize`, and s[start:end] gives the text of each token. Unlike the
+        strings from `tokenize`, these slices keep the original whitespace inside merged inline HTML elements.
+        """
+        tokens = self._tokenize(s)
+        spans = [(start, end) for _, start, end, _ in tokens]
+        return [spans[i:j] for i, j in self._sentences([token for token, _, _, _ in tokens])]
+
+    def tokenize_many(self, strings, workers=1, chunksize=100):
+        """Tokenize each string in an iterable, yielding the results in input order.
+
+        Strings are consumed lazily and at most a few chunks per worker are in progress at a time, so this can be used
+        as a stage in a generator pipeline over a corpus of any size.
+
+        :param strings: An iterable of strings.
+        :param workers: The number of worker processes, each with its own copy of this tokenizer. If None, use one per
+                        CPU. If 1, tokenize in this process.
+        :param chunksize: The number of strings to send to a worker at a time.
+
+        """
+        if workers == 1:
+            for s in strings:
+                yield self.tokenize(s)
+            return
+        pool = Pool(workers, initializer=_init_worker, initargs=(self,))
+        try:
+            strings = iter(strings)
+            pending = deque()
+            maxpending = 2 * (workers or cpu_count())
+            while True:
+                chunk = list(islice(strings, chunksize))
+                if chunk:
+                    pending.append(pool.apply_async(_tokenize_chunk, (chunk,)))
+                # Wait for the oldest chunk once enough are queued to keep every worker busy, or at the end
+                while pending and (not chunk or len(pending) >= maxpending):
+                    for result in pending.popleft().get():
+                        yield result
+                if not chunk:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
 
 
 def tokenize(s):
@@ -359,6 +766,20 @@ def tokenize(s):
     return ChemTokenizer().tokenize(s)
 
 
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer):
+    """Store the tokenizer for use in a tokenize_many worker process."""
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _tokenize_chunk(chunk):
+    """Tokenize a chunk of strings in a tokenize_many worker process."""
+    return [_worker_tokenizer.tokenize(s) for s in chunk]
+
+
 # TODO: Chemical entity tagger
 # - Custom feature detector?
 # - Feature ideas:
@@ -6,6 +6,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 
-from .clean import BLOCK_ELEMENTS, INLINE_ELEMENTS, HtmlCleaner
-from .meta import extract_metadata
+from .clean import BLOCK_ELEMENTS, INLINE_ELEMENTS, VOID_ELEMENTS, HtmlCleaner, LxmlTag
+from .meta import MetaIndex, extract_metadata
 
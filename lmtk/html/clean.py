@@ -15,6 +15,7 @@ from __future__ import division
 import re
 
 from bs4 import BeautifulSoup, Comment
+from lxml import etree
 
 from lmtk.text import normalize, u
 
@@ -31,6 +32,28 @@ INLINE_ELEMENTS = {
     'textarea'
 }
 
+VOID_ELEMENTS = {
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 'input',
+    'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr'
+}
+
+WHITESPACE_RE = re.compile(r'\s+', re.U)
+
+
+class LxmlTag(object):
+    """The name and attributes of an lxml element, passed to the HtmlCleaner hooks in place of a BeautifulSoup Tag.
+
+    Changes that `transform` makes to `name` and `attrs` are used in the output. The element itself is available as
+    `element` but shouldn't be modified.
+    """
+
+    __slots__ = ('name', 'attrs', 'element')
+
+    def __init__(self, element):
+        self.name = element.tag
+        self.attrs = dict(element.attrib)
+        self.element = element
+
 
 class HtmlCleaner(object):
     """HTML sanitizer that strips HTML tags.
@@ -50,13 +73,16 @@ class HtmlCleaner(object):
     :param allowed_tags: Tags to allow in output.
     :param banned_tags: Tags to remove completely from output, including their entire contents.
     :param allowed_attrs: Attributes to allow on the allowed tags.
+    :param backend: 'bs4' to parse with BeautifulSoup and unwrap tags in place, or 'lxml' to write the output in a single
+                    walk of an lxml tree. With 'lxml', the hooks are passed an LxmlTag instead of a BeautifulSoup Tag.
 
     """
 
-    def __init__(self, allowed_tags=None, banned_tags={'script', 'style'}, allowed_attrs=None):
+    def __init__(self, allowed_tags=None, banned_tags={'script', 'style'}, allowed_attrs=None, backend='bs4'):
         self.allowed_tags = allowed_tags
         self.banned_tags = banned_tags
         self.allowed_attrs = allowed_attrs
+        self.backend = backend
 
     def __call__(self, html):
         return self.clean(html)
@@ -78,8 +104,42 @@ class HtmlCleaner(object):
     def clean(self, html):
         """Clean the given HTML and return it.
 
-        :param html: The HTML to clean. Either as a string or BeautifulSoup object.
+        Already parsed lxml elements and Scrapy Selectors are cleaned straight from their tree with the lxml backend,
+        without serializing and parsing them again. The tree isn't modified.
+
+        :param html: The HTML to clean. Either as a string, BeautifulSoup object, lxml element or Scrapy Selector.
+        """
+        return self._clean(html)
+
+    def clean_many(self, nodes):
+        """Clean each of the given HTML strings, lxml elements or Scrapy Selectors and return a list of the results.
+
+        All the strings are parsed with the same parser.
         """
+        parser = etree.HTMLParser()
+        return [self._clean(node, parser) for node in nodes]
+
+    def _clean(self, html, parser=None):
+        """Clean the given HTML and return it, parsing any string with parser if given."""
+        # Scrapy Selectors wrap the lxml element or string they selected as root (or _root in older versions). Check the
+        # class, as BeautifulSoup treats any unknown attribute on a Tag as a search for a child tag.
+        if not isinstance(html, etree._Element) and hasattr(type(html), 'xpath'):
+            html = getattr(html, 'root', getattr(html, '_root', html))
+        if isinstance(html, etree._Element):
+            if self.backend == 'lxml':
+                html = self._clean_element(html)
+            else:
+                html = self._clean_bs4(etree.tostring(html, encoding='unicode', with_tail=False))
+        elif self.backend == 'lxml':
+            html = self._clean_lxml(html, parser)
+        else:
+            html = self._clean_bs4(html)
+        html = re.sub(r'\s*\n\s*', '\n', html)
+        html = re.sub(r'[ \t]+', ' ', html).strip()
+        return html
+
+    def _clean_bs4(self, html):
+        """Return the cleaned HTML, before whitespace is collapsed, by unwrapping tags in a BeautifulSoup tree."""
         html = BeautifulSoup(normalize(u(html)), 'lxml')
         for comment in html.find_all(text=lambda text: isinstance(text, Comment)):
             comment.extract()
@@ -101,6 +161,79 @@ class HtmlCleaner(object):
                         parent.insert(i, child)
                     if tag.name.lower() in BLOCK_ELEMENTS:
                         parent.insert(i, '\n')
-        html = re.sub(r'\s*\n\s*', '\n', html.decode_contents(formatter=None))
-        html = re.sub(r'[ \t]+', ' ', html).strip()
-        return html
+        return html.decode_contents(formatter=None)
+
+    def _clean_lxml(self, html, parser=None):
+        """Return the cleaned HTML, before whitespace is collapsed, by writing it out in one walk of an lxml tree."""
+        parser = parser or etree.HTMLParser()
+        parser.feed(normalize(u(html)))
+        try:
+            root = parser.close()
+        except etree.XMLSyntaxError:
+            # Depending on the lxml version, empty or whitespace-only input raises an error or gives no root
+            return ''
+        out = []
+        if root is not None:
+            self._write_element(root, out)
+        return ''.join(out)
+
+    def _clean_element(self, element):
+        """Return the cleaned HTML for an already parsed lxml element, before whitespace is collapsed.
+
+        Strings are normalized before they are parsed, so here the text and attributes of each node are normalized as
+        they are written instead.
+        """
+        out = []
+        if isinstance(element.tag, basestring):
+            self._write_element(element, out, _normalize_node_text)
+        return ''.join(out)
+
+    def _write_element(self, element, out, fix=None):
+        """Append the cleaned element, including its contents but not its tail, to the out list.
+
+        :param fix: Optional function to apply to each text, tail and attribute value.
+        """
+        tag = LxmlTag(element)
+        if self.banned and self.banned(tag):
+            return
+        if self.allowed and self.allowed(tag):
+            if self.transform:
+                self.transform(tag)
+            attrs = ''.join(' %s=%s' % (k, _quote_attr(fix(v) if fix else v)) for k, v in tag.attrs.items())
+            if tag.name in VOID_ELEMENTS and element.text is None and not len(element):
+                out.append('<%s%s/>' % (tag.name, attrs))
+            else:
+                out.append('<%s%s>' % (tag.name, attrs))
+                self._write_contents(element, out, fix)
+                out.append('</%s>' % tag.name)
+        elif tag.name.lower() in BLOCK_ELEMENTS:
+            out.append('\n')
+            self._write_contents(element, out, fix)
+            out.append('\n')
+        else:
+            self._write_contents(element, out, fix)
+
+    def _write_contents(self, element, out, fix=None):
+        """Append the cleaned text and children of the element to the out list."""
+        if element.text:
+            out.append(fix(element.text) if fix else element.text)
+        for child in element:
+            # Comments and processing instructions don't have a string tag, and are dropped but keep their tail text
+            if isinstance(child.tag, basestring):
+                self._write_element(child, out, fix)
+            if child.tail:
+                out.append(fix(child.tail) if fix else child.tail)
+
+
+def _normalize_node_text(text):
+    """Normalize the text of a parsed node, collapsing whitespace to a single space but keeping it at either end."""
+    return WHITESPACE_RE.sub(' ', normalize(text, collapse=False))
+
+
+def _quote_attr(value):
+    """Return the attribute value in quotes, choosing quotes that don't appear in the value where possible."""
+    if '"' not in value:
+        return '"%s"' % value
+    if "'" not in value:
+        return "'%s'" % value
+    return '"%s"' % value.replace('"', '&quot;')
@@ -12,31 +12,97 @@ Tools for extracting metadata from HTML.
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
-import re
 
-from bs4 import BeautifulSoup
+from bs4 import Tag
+from lxml import etree
 
 from lmtk.text import u
 from lmtk.bib import PersonName
 
 
-def extract_metadata(html):
-    """Parse a HTML page to extract embedded metadata.
+# The only elements extract_metadata reads: meta tags, links, the title and anything else with a rel attribute
+META_XPATH = etree.XPath('descendant-or-self::*[self::meta or self::link or self::title or @rel]')
 
-    TODO: Is this obsolete due to lmtk.scrape package?
 
-    :param html: The HTML to parse. Either as a string or BeautifulSoup object.
+class MetaIndex(object):
+    """The meta tags, links and title of a HTML page, collected in a single pass over the document.
+
+    `metas` maps each lowercase meta name to a list of (name, content) tuples in document order, where content is None
+    for meta tags without a content attribute. `links` is a list of (rel values, attributes) tuples for each link tag,
+    and `licenses` is a list of the href of each element with a license rel.
     """
-    def resolve_meta(names):
+
+    def __init__(self, html):
+        """Index a HTML page.
+
+        :param html: The HTML to index. Either as a string, BeautifulSoup object or lxml element or tree.
+        """
+        self.metas = {}
+        self.links = []
+        self.licenses = []
+        self.title = None
+        for name, attrs, text in _meta_elements(html):
+            if name == 'meta' and 'name' in attrs:
+                self.metas.setdefault(attrs['name'].lower(), []).append((attrs['name'], attrs.get('content')))
+            elif name == 'title' and self.title is None:
+                self.title = text
+            if 'rel' in attrs:
+                # Like BeautifulSoup, match either a single rel value or the whole attribute
+                rels = set(attrs['rel'].split()) | {attrs['rel']}
+                if name == 'link':
+                    self.links.append((rels, attrs))
+                if 'license' in rels and 'href' in attrs:
+                    self.licenses.append(attrs['href'])
+
+    def contents(self, name):
+        """Return a list of the content of each meta tag with exactly the given name, in document order."""
+        return [content for n, content in self.metas.get(name.lower(), ()) if n == name and content is not None]
+
+    def first(self, names):
         """Given a list of meta names, return the content of the first that is found."""
         for name in names:
-            try:
-                return u(html.find('meta', attrs={'name': name, 'content': True})['content'].strip())
-            except TypeError:
-                continue
-
+            contents = self.contents(name)
+            if contents:
+                return u(contents[0].strip())
+
+    def link(self, rel, types):
+        """Return the href of the first link with the given rel and a type in types."""
+        for rels, attrs in self.links:
+            if rel in rels and 'href' in attrs and attrs.get('type') in types:
+                return attrs['href']
+
+
+def _meta_elements(html):
+    """Yield a (tag name, attribute dict, text) tuple for each element that MetaIndex reads, in document order."""
+    if isinstance(html, Tag):
+        for el in html.find_all(lambda el: el.name in {'meta', 'link', 'title'} or 'rel' in el.attrs):
+            # BeautifulSoup splits multi-valued attributes like rel into lists
+            attrs = dict((k, ' '.join(v) if isinstance(v, list) else v) for k, v in el.attrs.items())
+            yield el.name, attrs, el.string
+        return
     if isinstance(html, basestring):
-        html = BeautifulSoup(html, 'lxml')
+        parser = etree.HTMLParser()
+        parser.feed(html)
+        try:
+            html = parser.close()
+        except etree.XMLSyntaxError:
+            # Depending on the lxml version, empty input raises an error or gives no root
+            return
+        if html is None:
+            return
+    for el in META_XPATH(html):
+        yield el.tag, el.attrib, el.text
+
+
+def extract_metadata(html):
+    """Parse a HTML page to extract embedded metadata.
+
+    TODO: Is this obsolete due to lmtk.scrape package?
+
+    :param html: The HTML to parse. Either as a string, BeautifulSoup object or lxml element or tree.
+    """
+    index = MetaIndex(html)
+    resolve_meta = index.first
 
     meta = {
         u'title': resolve_meta(['citation_title', 'dc.title', 'DC.title', 'title', 'citation_dissertation_name']),
@@ -67,12 +133,13 @@ def extract_metadata(html):
     # authors
     persons = []
     for metaname in ['citation_author', 'dc.creator', 'DC.creator']:
-        for el in html.find_all('meta', attrs={'name': metaname, 'content': True}):
-            person = PersonName(el['content'])
+        for content in index.contents(metaname):
+            person = PersonName(content)
             if person and not any(person.could_be(other) for other in persons):
                 persons.append(person)
     persons = [dict(p) for p in persons]
-    affiliations = [el.get('content', None) for el in html.find_all('meta', attrs={'name': 'citation_author_institution'})]
+    affiliations = [content for n, content in index.metas.get('citation_author_institution', ())
+                    if n == 'citation_author_institution']
     if len(affiliations) == len(persons):
         for i, aff in enumerate(affiliations):
             persons[i][u'affiliation'] = [u(aff)]
@@ -81,36 +148,36 @@ def extract_metadata(html):
     # keywords
     keywords = set()
     for metaname in ['dc.type', 'prism.section', 'citation_keywords']:
-        for el in html.find_all('meta', attrs={'name': metaname, 'content': True}):
-            kcomps = [u(k.strip()) for k in el['content'].split(',')]
+        for content in index.contents(metaname):
+            kcomps = [u(k.strip()) for k in content.split(',')]
             keywords.update(kcomps)
     meta[u'keywords'] = list(keywords)
 
     # last page
-    last = html.find('meta', attrs={'name': 'citation_lastpage', 'content': True})
-    if last and 'content' in last.attrs and 'page' in meta:
-        meta[u'page'] = '%s-%s' % (meta[u'page'], u(last['content']))
+    last = index.contents('citation_lastpage')
+    if last and 'page' in meta:
+        meta[u'page'] = '%s-%s' % (meta[u'page'], u(last[0]))
 
     # XML URL
-    xml = html.find('link', attrs={'rel': 'alternate',  'href': True,
-                                   'type': re.compile(r'^(text/xml|application/rdf\+xml)$')})
+    xml = index.link('alternate', {'text/xml', 'application/rdf+xml'})
     if xml:
-        meta[u'xml_url'] = u(xml['href'])
+        meta[u'xml_url'] = u(xml)
 
     # PDF URL backup
-    pdf = html.find('link', attrs={'rel': 'alternate', 'type': 'application/pdf', 'href': True})
+    pdf = index.link('alternate', {'application/pdf'})
     if not 'pdf_url' in meta and pdf:
-        meta[u'pdf_url'] = u(pdf['href'])
+        meta[u'pdf_url'] = u(pdf)
 
     # title backup
-    if not 'title' in meta and html.title:
-        meta[u'title'] = html.title.string.strip()
+    if not 'title' in meta and index.title:
+        meta[u'title'] = index.title.strip()
 
-    for el in html.find_all(attrs={'rel': 'license', 'href': True}):
-        meta[u'license'] = u(el['href'])
+    if index.licenses:
+        meta[u'license'] = u(index.licenses[-1])
     if not 'license' in meta:
-        lic = html.find('meta', attrs={'name': re.compile(r'^dc\.rights$', re.I), 'content': True})
+        # Unlike the other meta names, dc.rights is matched case-insensitively
+        lic = [content for n, content in index.metas.get('dc.rights', ()) if content is not None]
         if lic:
-            meta[u'license'] = u(lic['content'])
+            meta[u'license'] = u(lic[0])
     meta = dict([(k, v) for k, v in meta.items() if v])
     return meta
@@ -15,41 +15,109 @@ from __future__ import division
 import datetime
 
 from pymongo import MongoClient
-from scrapy import log
+from scrapy import log, signals
 from scrapy.exceptions import IgnoreRequest
+from twisted.internet import task, threads
 
 
 class MongoDBDuplicateMiddleware(object):
     """Duplicate filter that checks if the url exists in MongoDB and ignores the request if it was recently scraped.
 
     This can be used either instead or in conjunction with the regular session dupefilter.
+
+    When the spider opens, the time each url was last scraped is loaded into memory for every url scraped within the
+    longest lifetime of its parserules. This is refreshed in a background thread every `MONGODB_DUPLICATE_REFRESH`
+    seconds, so checking a request doesn't need to query MongoDB or block the reactor.
     """
 
     @classmethod
     def from_crawler(cls, crawler):
         """Initialize with settings from crawler."""
         settings = crawler.settings
-        return cls(settings)
+        middleware = cls(settings)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(middleware.item_scraped, signal=signals.item_scraped)
+        return middleware
+
+    def __init__(self, settings, collection=None):
+        """Connect to MongoDB and ensure the indexes needed to load recent scrapes.
 
-    def __init__(self, settings):
+        :param settings: The crawler settings.
+        :param collection: An optional collection to use instead of connecting to the one in the settings.
+        """
         # Get crawler settings
         self._uri = settings.get('MONGODB_URI', 'mongodb://localhost:27017')
         self._database = settings.get('MONGODB_DATABASE', 'lmtk')
         self._collection = settings.get('MONGODB_COLLECTION', 'scrape')
-        # Connect to MongoDB and ensure unique index on url key
-        connection = MongoClient(self._uri)
-        self.collection = connection[self._database][self._collection]
-        log.msg('Connected to MongoDB: {0}/{1}/{2}'.format(self._uri, self._database, self._collection))
+        self._refresh_interval = float(settings.get('MONGODB_DUPLICATE_REFRESH', 300))
+        # Connect to MongoDB
+        if collection is None:
+            connection = MongoClient(self._uri)
+            collection = connection[self._database][self._collection]
+            log.msg('Connected to MongoDB: {0}/{1}/{2}'.format(self._uri, self._database, self._collection))
+        self.collection = collection
+        # Ensure indexes for finding scrapes by url and for loading recent scrapes
+        self.collection.create_index('scrape.url')
+        self.collection.create_index('scrape.updated')
+        #: The time each url was last scraped, for urls scraped within the lifetime window.
+        self.updated = {}
+        # The latest scrape time loaded, so refreshes only need to load scrapes that are newer
+        self._since = None
+        self._refresh_loop = None
 
-    def process_request(self, request, spider):
-        lifetime = 0
-        for parserule in spider.parserules:
-            if parserule.url.search(request.url):
-                lifetime = parserule.lifetime
+    def spider_opened(self, spider):
+        """Load the recently scraped urls and start refreshing them in the background."""
+        lifetime = max([parserule.lifetime for parserule in spider.parserules] or [0])
         if lifetime:
-            existing = self.collection.find({'scrape.url': request.url})
-            if existing.count() > 0:
-                age = max([(datetime.datetime.utcnow() - scrape['scrape']['updated']).days for scrape in existing])
-                if age <= lifetime:
-                    log.msg('Skipping existing (%s days old): %s' % (age, request.url), level=log.INFO, request=request, spider=spider)
-                    raise IgnoreRequest
+            # Ages are compared in whole days, so anything less than a day past the lifetime still counts
+            self.load(datetime.datetime.utcnow() - datetime.timedelta(days=lifetime + 1))
+            log.msg('Loaded %s recently scraped urls from MongoDB' % len(self.updated), spider=spider)
+            self._refresh_loop = task.LoopingCall(self.refresh)
+            self._refresh_loop.start(self._refresh_interval, now=False)
+
+    def spider_closed(self, spider):
+        """Stop refreshing the recently scraped urls."""
+        if self._refresh_loop and self._refresh_loop.running:
+            self._refresh_loop.stop()
+
+    def item_scraped(self, item, response, spider):
+        """Record the url of an item as just scraped, without waiting for the next refresh."""
+        scrape = item.get('scrape')
+        if scrape:
+            self.updated[scrape['url']] = datetime.datetime.utcnow()
+
+    def _find(self, since):
+        """Return a list of (url, updated) tuples for each scrape updated at or after since."""
+        docs = self.collection.find({'scrape.updated': {'$gte': since}}, {'scrape.url': True, 'scrape.updated': True})
+        return [(doc['scrape']['url'], doc['scrape']['updated']) for doc in docs]
+
+    def _merge(self, scrapes):
+        """Update the last scraped time of each url from a list of (url, updated) tuples."""
+        for url, updated in scrapes:
+            if url not in self.updated or updated > self.updated[url]:
+                self.updated[url] = updated
+            if updated > self._since:
+                self._since = updated
+
+    def load(self, since):
+        """Load the last scraped time of every url scraped at or after since."""
+        self._since = since
+        self._merge(self._find(since))
+
+    def refresh(self):
+        """Load scrapes that were updated since the last load in a thread, and merge them in the reactor thread."""
+        d = threads.deferToThread(self._find, self._since)
+        d.addCallback(self._merge)
+        d.addErrback(log.err, 'Failed to refresh recently scraped urls from MongoDB')
+        return d
+
+    def process_request(self, request, spider):
+        # The last matching parserule determines the lifetime
+        parserules = spider.parserules_for(request)
+        lifetime = parserules[-1].lifetime if parserules else 0
+        if lifetime and request.url in self.updated:
+            age = (datetime.datetime.utcnow() - self.updated[request.url]).days
+            if age <= lifetime:
+                log.msg('Skipping existing (%s days old): %s' % (age, request.url), level=log.INFO, request=request, spider=spider)
+                raise IgnoreRequest
@@ -14,29 +14,85 @@ from __future__ import unicode_literals
 from __future__ import division
 
 import datetime
+import hashlib
+import json
+import time
 
+import six
+from pymongo import ASCENDING
 from pymongo.mongo_client import MongoClient
 from scrapy import log, Item
+from twisted.internet import defer, task, threads
 
 
 class MongoDBPipeline(object):
-    """MongoDB ItemPipeline to save scraped items in a MongoDB collection."""
+    """MongoDB ItemPipeline to save scraped items in a MongoDB collection.
+
+    Items are buffered and upserted in bulk, keyed on their DOI, spider and parser, whenever `MONGODB_BATCH_SIZE` items
+    have been buffered or every `MONGODB_BATCH_INTERVAL` seconds. Each batch is written in a thread, one at a time, so
+    saving items doesn't block the reactor. A batch that fails to be written is tried again on the next flush, up to
+    `MONGODB_RETRIES` times, before its items are counted as failed.
+
+    A hash of the content of each item, ignoring the scrape metadata, is stored as `scrape.hash`. When an item is
+    scraped again without any changes, only its `scrape.updated` time is changed.
+    """
 
     @classmethod
     def from_crawler(cls, crawler):
         """Initialize with settings from crawler."""
         settings = crawler.settings
-        return cls(settings)
+        return cls(settings, stats=crawler.stats)
 
-    def __init__(self, settings):
+    def __init__(self, settings, stats=None, collection=None):
+        """Connect to MongoDB.
+
+        :param settings: The crawler settings.
+        :param stats: An optional stats collector to record the number of items saved and the rate they are saved at.
+        :param collection: An optional collection to use instead of connecting to the one in the settings.
+        """
         # Get crawler settings
         self._uri = settings.get('MONGODB_URI', 'mongodb://localhost:27017')
         self._database = settings.get('MONGODB_DATABASE', 'lmtk')
         self._collection = settings.get('MONGODB_COLLECTION', 'scrape')
-        # Connect to MongoDB and ensure unique index on url key
-        connection = MongoClient(self._uri)
-        self.collection = connection[self._database][self._collection]
-        log.msg('Connected to MongoDB: {0}/{1}/{2}'.format(self._uri, self._database, self._collection))
+        self._batch_size = int(settings.get('MONGODB_BATCH_SIZE', 100))
+        self._batch_interval = float(settings.get('MONGODB_BATCH_INTERVAL', 5))
+        self._retries = int(settings.get('MONGODB_RETRIES', 3))
+        # Connect to MongoDB
+        if collection is None:
+            connection = MongoClient(self._uri)
+            collection = connection[self._database][self._collection]
+            log.msg('Connected to MongoDB: {0}/{1}/{2}'.format(self._uri, self._database, self._collection))
+        self.collection = collection
+        self.stats = stats
+        # Items waiting to be written, as (spec, update) tuples
+        self._buffer = []
+        # Batches that failed to be written, as (batch, attempts) tuples, to try again before the buffer
+        self._retry = []
+        self._items_failed = 0
+        # Only one batch is written at a time, so batches are written in order
+        self._lock = defer.DeferredLock()
+        self._flush_loop = None
+        self._started = None
+
+    def open_spider(self, spider):
+        """Ensure the index that items are upserted by, and start flushing items periodically."""
+        self.collection.create_index([('doi', ASCENDING), ('scrape.spider', ASCENDING), ('scrape.parser', ASCENDING)])
+        self._started = time.time()
+        self._flush_loop = task.LoopingCall(self.flush)
+        self._flush_loop.start(self._batch_interval, now=False)
+
+    def close_spider(self, spider):
+        """Stop flushing periodically and write any remaining items, retrying failed batches as many times as set."""
+        if self._flush_loop and self._flush_loop.running:
+            self._flush_loop.stop()
+        return self.flush().addCallback(self._closed)
+
+    def _closed(self, result):
+        """Flush again while there are batches left to retry, then log an error if any items couldn't be written."""
+        if self._retry:
+            return self.flush().addCallback(self._closed)
+        if self._items_failed:
+            log.msg('Failed to save %s items to MongoDB' % self._items_failed, level=log.ERROR)
 
     def _to_dict(self, item):
         """Convert Scrapy item to python dictionary. Handles nested items."""
@@ -50,21 +106,114 @@ class MongoDBPipeline(object):
                         value[i] = self._to_dict(el)
         return doc
 
+    def _upsert(self, fields, doc):
+        """Return the (spec, update) to upsert a doc, replacing any existing doc from the same DOI, spider and parser.
+
+        The scrape created time is only set when the doc is inserted. Other item fields that the doc doesn't have are
+        unset, so the result is the same as replacing the existing doc.
+        """
+        scrape = doc['scrape']
+        spec = {'doi': doc['doi'], 'scrape.spider': scrape['spider'], 'scrape.parser': scrape['parser']}
+        # Set scrape fields individually, as setting the whole scrape doc would conflict with setting its created time
+        update = {
+            '$set': dict([(k, v) for k, v in doc.items() if k != 'scrape'] +
+                         [('scrape.%s' % k, v) for k, v in scrape.items() if k != 'created']),
+            '$setOnInsert': {'scrape.created': scrape['created']}
+        }
+        unset = dict((field, '') for field in fields if field not in doc)
+        if unset:
+            update['$unset'] = unset
+        return spec, update
+
+    def _hash(self, doc):
+        """Return a hash of the content of a doc, ignoring the scrape metadata."""
+        content = dict((k, v) for k, v in doc.items() if k != 'scrape')
+        dump = json.dumps(content, sort_keys=True, separators=(',', ':'), default=six.text_type)
+        return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+    def _existing_hashes(self, specs):
+        """Return a dict of the stored content hash for each (DOI, spider, parser) that already has a doc."""
+        fields = {'doi': True, 'scrape.spider': True, 'scrape.parser': True, 'scrape.hash': True}
+        hashes = {}
+        for doc in self.collection.find({'$or': specs}, fields):
+            hashes[(doc.get('doi'), doc['scrape']['spider'], doc['scrape']['parser'])] = doc['scrape'].get('hash')
+        return hashes
+
+    def _write(self, batch):
+        """Upsert a batch of docs in a single bulk operation. Returns the number of new, updated and unchanged docs.
+
+        Docs whose content hash matches the stored doc only have their updated time changed, rather than being
+        rewritten in full.
+        """
+        existing = self._existing_hashes([spec for spec, update in batch])
+        counts = {'new': 0, 'updated': 0, 'unchanged': 0}
+        bulk = self.collection.initialize_ordered_bulk_op()
+        for spec, update in batch:
+            key = (spec['doi'], spec['scrape.spider'], spec['scrape.parser'])
+            content_hash = update['$set']['scrape.hash']
+            if key not in existing:
+                counts['new'] += 1
+            elif existing[key] == content_hash:
+                counts['unchanged'] += 1
+                bulk.find(spec).update_one({'$set': {'scrape.updated': update['$set']['scrape.updated']}})
+                continue
+            else:
+                counts['updated'] += 1
+            # Later items in the same batch with the same key are compared with this one
+            existing[key] = content_hash
+            bulk.find(spec).upsert().update_one(update)
+        bulk.execute()
+        return counts
+
+    def _written(self, counts):
+        """Record a written batch in the stats."""
+        log.msg('Saved %(new)s new, %(updated)s updated and %(unchanged)s unchanged items to MongoDB' % counts,
+                level=log.DEBUG)
+        if self.stats:
+            self.stats.inc_value('mongodb/items_saved', sum(counts.values()))
+            for status, count in counts.items():
+                self.stats.inc_value('mongodb/items_%s' % status, count)
+            self.stats.inc_value('mongodb/batches')
+            elapsed = time.time() - self._started if self._started else 0
+            if elapsed:
+                self.stats.set_value('mongodb/items_per_second', self.stats.get_value('mongodb/items_saved') / elapsed)
+
+    def _write_failed(self, failure, batch, attempts):
+        """Keep a batch that failed to be written to try again on the next flush, or count its items as failed."""
+        if attempts <= self._retries:
+            log.err(failure, 'Failed to save %s items to MongoDB, will retry' % len(batch))
+            self._retry.append((batch, attempts))
+        else:
+            log.err(failure, 'Failed to save %s items to MongoDB after %s attempts' % (len(batch), attempts))
+            self._items_failed += len(batch)
+            if self.stats:
+                self.stats.inc_value('mongodb/items_failed', len(batch))
+
+    def flush(self):
+        """Write any batches to retry and then the buffered items in a thread.
+
+        Returns a Deferred that fires when they have been written or failed.
+        """
+        batches, self._retry = self._retry, []
+        if self._buffer:
+            batches.append((self._buffer, 0))
+            self._buffer = []
+        deferreds = []
+        for batch, attempts in batches:
+            d = self._lock.run(threads.deferToThread, self._write, batch)
+            d.addCallbacks(self._written, self._write_failed, errbackArgs=(batch, attempts + 1))
+            deferreds.append(d)
+        return defer.gatherResults(deferreds)
+
     def process_item(self, item, spider):
         """Add item to MongoDB."""
         doc = self._to_dict(item)
         now = datetime.datetime.utcnow()
         doc['scrape']['created'] = now
         doc['scrape']['updated'] = now
-        # Update existing document if paper has already been scraped by this parser. Otherwise add as new.
-        existing = self.collection.find_one({
-            'doi': doc['doi'],
-            'scrape.spider': doc['scrape']['spider'],
-            'scrape.parser': doc['scrape']['parser'],
-        })
-        if existing:
-            doc['_id'] = existing['_id']
-            doc['scrape']['created'] = existing['scrape']['created']
-        self.collection.save(doc)
-        log.msg('Saved item to MongoDB', level=log.DEBUG, spider=spider)
+        doc['scrape']['hash'] = self._hash(doc)
+        # Get the upsert here, so an item without a DOI fails alone rather than with the rest of its batch
+        self._buffer.append(self._upsert(item.fields, doc))
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
         return item
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+lmtk.scrape.router
+~~~~~~~~~~~~~~~~~~
+
+Choose the spider responsible for a URL or DOI, and crawl a list of them with the right spiders.
+
+:copyright: Copyright 2014 by Matt Swain.
+:license: MIT, see LICENSE file for more details.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import re
+
+from six.moves.urllib.parse import urlparse
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.utils.project import get_project_settings
+from twisted.internet import reactor
+
+from lmtk.scrape.spiders.generic import combine_patterns
+
+
+#: Matches the host part of a URL pattern that starts with a scheme.
+HOST_PATTERN_RE = re.compile(r'^\^?https?\??://([^/]*)')
+
+#: Matches the literal end of the host part of a URL pattern, treating an unescaped dot as a literal dot.
+LITERAL_HOST_RE = re.compile(r'(?<!\\)(?:[A-Za-z\d\-.]|\\\.)+$')
+
+#: Matches a DOI, optionally prefixed with "doi:".
+DOI_RE = re.compile(r'^(?:doi:\s*)?(10\.\d+/\S+)$', re.I)
+
+#: The URL to start scraping a DOI from.
+DOI_URL = 'http://dx.doi.org/{}'
+
+
+def _pattern_host(pattern):
+    """Return the lowercase literal end of the host in a URL pattern, or None if it doesn't have one.
+
+    For example, 'pubs.rsc.org' for 'http://pubs\.rsc\.org/en/' and 'rsc.org' for 'http://(xlink|feeds)\.rsc\.org/'.
+    Hosts without at least two labels are too broad to be useful, so None is returned for those too.
+    """
+    match = HOST_PATTERN_RE.match(pattern)
+    if match:
+        literal = LITERAL_HOST_RE.search(match.group(1))
+        if literal:
+            host = literal.group().replace('\\.', '.').strip('.-').lower()
+            if '.' in host:
+                return host
+
+
+class SpiderRouter(object):
+    """An index of GenericSpider classes for choosing the spider responsible for a URL or DOI.
+
+    Crawl patterns that start with a scheme are indexed by the literal end of their host, and the patterns for each
+    host are combined into one regular expression. Choosing a spider for a URL then takes a dictionary lookup for each
+    label in its host and usually a single regular expression search, rather than a search with every pattern of every
+    spider. Patterns without a literal host are checked against every URL. Patterns that can't be combined (e.g. those
+    with numbered backreferences or inline flags) are searched on their own.
+
+    When more than one spider could handle a URL, the one registered first is chosen. DOIs are routed by the `dois`
+    prefixes of each spider.
+
+    Example usage:
+
+        router = SpiderRouter([RscSpider])
+        router.spider_for('http://pubs.rsc.org/en/content/articlelanding/2014/cc/c4cc01234a')
+        routes, unrouted = router.route(['10.1039/c4cc01234a', 'http://pubs.rsc.org/en/journals/journalissues/cc'])
+
+    """
+
+    def __init__(self, spiders=()):
+        """Initialize an index of the given spider classes.
+
+        :param spiders: GenericSpider subclasses to register, in order of priority.
+        """
+        self.spiders = []
+        self._patterns = {}
+        self._regexes = {}
+        self._dois = {}
+        for spider in spiders:
+            self.register(spider)
+
+    def register(self, spider):
+        """Add a GenericSpider subclass to the index, with lower priority than those already registered."""
+        self.spiders.append(spider)
+        for pattern in spider.crawl:
+            host = _pattern_host(pattern)
+            patterns = self._patterns.setdefault(host, [])
+            patterns.append((spider, pattern))
+            self._regexes.pop(host, None)
+        for prefix in spider.dois:
+            self._dois.setdefault(prefix, spider)
+
+    def _regex(self, host):
+        """Return a tuple of the regexes for the patterns indexed under host and their spiders, or None."""
+        if host not in self._regexes:
+            spiders = []
+            patterns = []
+            for spider, pattern in self._patterns.get(host, ()):
+                if spider not in spiders:
+                    spiders.append(spider)
+                patterns.append(pattern)
+            self._regexes[host] = (combine_patterns(patterns), spiders) if spiders else None
+        return self._regexes[host]
+
+    def _match(self, host, url):
+        """Return the spider that handles url out of those with patterns indexed under host, or None."""
+        entry = self._regex(host)
+        if entry:
+            regexes, spiders = entry
+            if any(regex.search(url) for regex in regexes):
+                # The leftmost match may not be from the spider with the highest priority, and the spider it is from may
+                # ignore this URL, so check the spiders in order now that at least one pattern is known to match
+                for spider in spiders:
+                    if spider.handles_url(url):
+                        return spider
+
+    def spider_for(self, url):
+        """Return the spider class responsible for the given URL, or None."""
+        labels = (urlparse(url).hostname or '').split('.')
+        candidates = []
+        for host in ['.'.join(labels[i:]) for i in range(len(labels) - 1)] + [None]:
+            spider = self._match(host, url)
+            if spider:
+                candidates.append(spider)
+        if candidates:
+            return min(candidates, key=self.spiders.index)
+
+    def spider_for_doi(self, doi):
+        """Return the spider class responsible for the given DOI, or None."""
+        return self._dois.get(doi.split('/', 1)[0])
+
+    def route(self, targets):
+        """Group a list of URLs and DOIs by the spider responsible for each.
+
+        DOIs are routed by their prefix and start from their dx.doi.org URL.
+
+        :returns: A tuple of a dict from spider class to a list of start URLs, and a list of the targets that no spider
+                  is responsible for.
+        """
+        routes = {}
+        unrouted = []
+        for target in targets:
+            target = target.strip()
+            doi = DOI_RE.match(target)
+            if doi:
+                spider = self.spider_for_doi(doi.group(1))
+                url = DOI_URL.format(doi.group(1))
+            else:
+                spider = self.spider_for(target)
+                url = target
+            if spider:
+                routes.setdefault(spider, []).append(url)
+            else:
+                unrouted.append(target)
+        return routes, unrouted
+
+
+def crawl(targets, spiders, settings=None):
+    """Scrape a list of URLs and DOIs, starting each spider on the targets it is responsible for.
+
+    This runs the Twisted reactor until every spider has closed.
+
+    :param targets: The URLs and DOIs to scrape.
+    :param spiders: GenericSpider subclasses to choose from, in order of priority.
+    :param settings: Scrapy settings. By default, the project settings are used.
+    :returns: The targets that no spider is responsible for.
+    """
+    routes, unrouted = SpiderRouter(spiders).route(targets)
+    settings = settings or get_project_settings()
+    running = [len(routes)]
+
+    def spider_closed():
+        running[0] -= 1
+        if not running[0]:
+            reactor.stop()
+
+    for spider, urls in routes.items():
+        crawler = Crawler(settings)
+        crawler.signals.connect(spider_closed, signal=signals.spider_closed)
+        crawler.configure()
+        crawler.crawl(spider(start_urls=urls))
+        crawler.start()
+    if routes:
+        reactor.run()
+    return unrouted
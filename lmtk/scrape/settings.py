@@ -26,3 +26,7 @@ ITEM_PIPELINES = {
 MONGODB_URI = 'mongodb://localhost:27017'
 MONGODB_DATABASE = 'lmtk'
 MONGODB_COLLECTION = 'scrape'
+MONGODB_DUPLICATE_REFRESH = 300
+MONGODB_BATCH_SIZE = 100
+MONGODB_BATCH_INTERVAL = 5
+MONGODB_RETRIES = 3
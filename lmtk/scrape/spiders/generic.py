@@ -12,9 +12,11 @@ Generic spiders to subclass for specific sites or to use directly when less info
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
+import os
 import re
 
 import six
+from lxml import etree
 from scrapy import Spider, Request, Item, log
 from scrapy.contrib.loader import Identity, ItemLoader
 from scrapy.contrib.loader.processor import TakeFirst, MapCompose, Compose
@@ -27,6 +29,16 @@ from lmtk.scrape.items import Paper, Figure, Reference, Supplement, Table, Subst
 from lmtk.text import normalize
 
 
+#: Matches default xpaths that just select the content of meta tags with a given name.
+META_CONTENT_RE = re.compile(r'^//meta\[@name="([^"]+)"\]/@content$')
+
+#: Selects every meta tag with a name and content, for answering all the meta content xpaths in one evaluation.
+META_XPATH = etree.XPath('//meta[@name and @content]')
+
+#: Matches inline flags, which apply to the whole regex that they are in.
+INLINE_FLAGS_RE = re.compile(r'\(\?[aiLmsux]+\)')
+
+
 class LmtkItemLoader(ItemLoader):
     """Root lmtk ItemLoader"""
     #: Use `lmtk.text.normalize` on each input by default.  # TODO: Maybe not?
@@ -35,17 +47,125 @@ class LmtkItemLoader(ItemLoader):
     #: Take first match for each field by default.
     default_output_processor = TakeFirst()
 
+    #: The default xpaths of each loader class, as lists of (field, [(meta name, xpath)]) tuples.
+    _loader_xpaths = {}
+
     def add_loader_xpaths(self):
         """Allows default xpaths for item fields to be specified in the ItemLoader.
 
         Subclasses must define a default_item_class to use this method.
+
+        Xpaths of the form `//meta[@name="..."]/@content` are all answered from a single pass over the meta tags in the
+        document, and any other xpaths are evaluated as normal. Either way, values are added in the order the xpaths are
+        listed, so the first xpath for a field still takes priority.
         """
-        for field in self.default_item_class.fields:
-            try:
-                for xpath in self.__getattribute__(field):
+        cls = type(self)
+        if cls not in self._loader_xpaths:
+            self._loader_xpaths[cls] = cls._parse_loader_xpaths()
+        metas = {}
+        # Scrapy selectors wrap the lxml root as root (or _root in older versions)
+        for el in META_XPATH(getattr(self.selector, 'root', getattr(self.selector, '_root', None))):
+            metas.setdefault(el.get('name'), []).append(six.text_type(el.get('content')))
+        for field, xpaths in self._loader_xpaths[cls]:
+            for name, xpath in xpaths:
+                if name is None:
                     self.add_xpath(field, xpath)
-            except AttributeError:
-                pass
+                elif name in metas:
+                    self.add_value(field, metas[name])
+
+    @classmethod
+    def _parse_loader_xpaths(cls):
+        """Return the default xpaths for each field, with the meta name for xpaths that just select meta content."""
+        fields = []
+        for field in cls.default_item_class.fields:
+            xpaths = getattr(cls, field, None)
+            if xpaths is not None:
+                matches = [META_CONTENT_RE.match(xpath) for xpath in xpaths]
+                fields.append((field, [(m.group(1) if m else None, xpath) for m, xpath in zip(matches, xpaths)]))
+        return fields
+
+
+def _class_end(pattern, i):
+    """Return the index of the ] that closes the character class starting at index i of a regex pattern."""
+    # A ] at the start of the class is literal
+    i += 3 if pattern[i + 1:i + 2] == '^' else 2
+    while i < len(pattern) and pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i
+
+
+def can_combine(pattern):
+    """Return True if a regex pattern means the same when it is one alternative in a larger regex.
+
+    Numbered backreferences and conditionals refer to different groups in a larger regex, and inline flags such as (?i)
+    apply to the whole regex. Patterns with any of these must be searched on their own.
+    """
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if pattern[i + 1:i + 2].isdigit() and pattern[i + 1] != '0':
+                return False
+            i += 1
+        elif c == '[':
+            i = _class_end(pattern, i)
+        elif pattern.startswith('(?(', i) or INLINE_FLAGS_RE.match(pattern, i):
+            return False
+        i += 1
+    return True
+
+
+def combine_patterns(patterns):
+    """Return a list of regexes that together match the same strings as any of the given patterns.
+
+    Patterns are combined into one regex where possible, and any others are compiled on their own.
+    """
+    combined = [p for p in patterns if can_combine(p)]
+    regexes = [re.compile(p) for p in patterns if not can_combine(p)]
+    if combined:
+        try:
+            regexes.insert(0, re.compile('|'.join('(?:%s)' % p for p in combined)))
+        except (re.error, AssertionError):
+            # Repeated group names and too many groups only fail when combined
+            regexes[:0] = [re.compile(p) for p in combined]
+    return regexes
+
+
+def _split_literal_prefix(pattern):
+    """Split a regex pattern into the literal text that every match must start with, and the rest of the pattern.
+
+    Patterns that contain a top-level alternation have no literal prefix, as it would only apply to the first branch.
+    """
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            i = _class_end(pattern, i)
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and not depth:
+            return '', pattern
+        i += 1
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and not pattern[i + 1:i + 2].isalnum():
+            char, end = pattern[i + 1:i + 2], i + 2
+        elif pattern[i] not in '.^$*+?{}[]|()\\':
+            char, end = pattern[i], i + 1
+        else:
+            break
+        # A quantified character may not be there, or may be repeated
+        if pattern[end:end + 1] in ('*', '+', '?', '{'):
+            break
+        prefix.append(char)
+        i = end
+    return ''.join(prefix), pattern[i:]
 
 
 def _strip_start(number):
@@ -145,6 +265,10 @@ class ParseRule(object):
         self.subparsers = subparsers
         self.lifetime = lifetime
 
+    def matches(self, url):
+        """Return True if url matches the url pattern of this rule and not its ignore pattern."""
+        return bool(self.url.search(url)) and not (self.ignore and self.ignore.search(url))
+
 
 class GenericSpider(Spider):
     """Generic spider."""
@@ -158,6 +282,12 @@ class GenericSpider(Spider):
     #: An optional list of URL pattern strings that this spider is not able to crawl. Supersedes `crawl`.
     ignore = ()
 
+    #: An optional list of DOI prefixes for papers that this spider is able to scrape, used to route DOIs to spiders.
+    dois = ()
+
+    #: The compiled `crawl` and `ignore` patterns for each spider class.
+    _url_regexes = {}
+
     #: ItemLoaders allow common scraping and processing tasks to be shared between parse methods.
     paper_loader = PaperLoader
     figure_loader = FigureLoader
@@ -189,6 +319,65 @@ class GenericSpider(Spider):
         for rule in self.parserules:
             rule.parser = self._get_method(rule.parser)
             rule.subparsers = [self._get_method(sp) for sp in rule.subparsers]
+        # Every match of a url pattern contains its literal prefix, so a rule can't match a url that doesn't contain it
+        splits = [('', rule.url.pattern) if rule.url.flags & (re.IGNORECASE | re.VERBOSE)
+                  else _split_literal_prefix(rule.url.pattern) for rule in self.parserules]
+        self._parserule_literals = [prefix for prefix, rest in splits]
+        # For each rule, the other rules that could match the same url, with the literal prefix that the url must also
+        # contain, or None if every url that the rule matches already contains it
+        self._parserule_checks = [
+            [(j, other if other and not literal.startswith(other) else None)
+             for j, other in enumerate(self._parserule_literals) if j != i]
+            for i, literal in enumerate(self._parserule_literals)
+        ]
+        # Combine the url patterns into one regex with a named group for each rule, so one search finds if any match
+        self._parserule_regex = None
+        # Inline flags apply to the whole regex, so patterns are only combined if they all have the same flags
+        if len(set(rule.url.flags for rule in self.parserules)) == 1 and \
+                all(can_combine(rule.url.pattern) for rule in self.parserules):
+            # Factor out any literal prefix shared by every pattern (e.g. the scheme and host), because the regex engine
+            # can only skip quickly to possible match positions when the whole regex starts with a literal
+            common = os.path.commonprefix(self._parserule_literals)
+            branches = ['(?P<r%s>%s%s)' % (i, re.escape(prefix[len(common):]), rest)
+                        for i, (prefix, rest) in enumerate(splits)]
+            try:
+                self._parserule_regex = re.compile('%s(?:%s)' % (re.escape(common), '|'.join(branches)))
+            except (re.error, AssertionError):
+                # Patterns that can't be combined (e.g. repeated group names, too many groups) are searched in turn
+                pass
+
+    def _match_parserules(self, url):
+        """Return the indexes of the parserules that match the given URL."""
+        if not self._parserule_regex:
+            return tuple(i for i, rule in enumerate(self.parserules)
+                         if self._parserule_literals[i] in url and rule.matches(url))
+        match = self._parserule_regex.search(url)
+        if not match:
+            return ()
+        # The combined search only reports the leftmost matching rule. Others can only match if the url contains their
+        # literal prefix too, which is rare unless they share a prefix with the rule that was found
+        first = int(match.lastgroup[1:])
+        rule = self.parserules[first]
+        indexes = [] if rule.ignore and rule.ignore.search(url) else [first]
+        for i, literal in self._parserule_checks[first]:
+            if (literal is None or literal in url) and self.parserules[i].matches(url):
+                indexes.append(i)
+        return tuple(sorted(indexes))
+
+    def parserules_for(self, r):
+        """Return the parserules that match the URL of a request or response, in order.
+
+        The matching rules are cached on the request meta, so the downloader middleware and `parse` only need to find
+        them once for each URL. The cache is keyed by the URL, so redirected requests are matched again.
+        """
+        meta = getattr(r, 'meta', {})
+        cached = meta.get('parserules')
+        if cached and cached[0] == r.url:
+            indexes = cached[1]
+        else:
+            indexes = self._match_parserules(r.url)
+            meta['parserules'] = (r.url, indexes)
+        return [self.parserules[i] for i in indexes]
 
     def _get_method(self, method):
         """Resolve method name string to actual method."""
@@ -197,17 +386,30 @@ class GenericSpider(Spider):
         elif isinstance(method, six.string_types):
             return getattr(self, method, None)
 
+    @classmethod
+    def url_regexes(cls):
+        """Return a (crawl, ignore) tuple of lists of regexes that combine the patterns of this spider class.
+
+        These are compiled on first use and then shared by all instances.
+        """
+        if cls not in cls._url_regexes:
+            cls._url_regexes[cls] = (combine_patterns(cls.crawl), combine_patterns(cls.ignore))
+        return cls._url_regexes[cls]
+
+    @classmethod
+    def handles_url(cls, url):
+        """Return True if this spider can handle the given URL."""
+        crawl, ignore = cls.url_regexes()
+        return any(r.search(url) for r in crawl) and not any(r.search(url) for r in ignore)
+
     @classmethod
     def handles_request(cls, request):
         """Return True if this spider can handle the given request.
 
-        This is used to choose the correct spider when scraping an arbitrary URL.
+        This is used to choose the correct spider when scraping an arbitrary URL. Use `lmtk.scrape.router.SpiderRouter`
+        to choose between many spiders.
         """
-        if not any(r.search(request.url) for r in [re.compile(regex) for regex in cls.crawl]):
-            return False
-        if any(r.search(request.url) for r in [re.compile(regex) for regex in cls.ignore]):
-            return False
-        return True
+        return cls.handles_url(request.url)
 
     def canonicalize(self, url):
         """Override to perform any additional url canonicalization that is specific to this spider."""
@@ -223,22 +425,21 @@ class GenericSpider(Spider):
         for l in self._link_extractor.extract_links(response):
             yield Request(self.canonicalize(l.url))
         # Find and run relevant parser methods
-        for parserule in self.parserules:
-            if parserule.url.search(response.url):
-                results = parserule.parser(response) or ()
-                for result in iterate_spider_output(results):
-                    # For each item, run any relevant subparsers to add nested information
-                    if isinstance(result, Item):
-                        for subparser in parserule.subparsers:
-                            result = subparser(response, result)
-                        # Add the URL we parsed the item from
-                        result['scrape'] = {
-                            'url': self.canonicalize(response.url),
-                            'spider': self.name,
-                            'parser': parserule.parser.__name__
-                        }
-                    result = self.process_result(response, result)
-                    yield result
+        for parserule in self.parserules_for(response):
+            results = parserule.parser(response) or ()
+            for result in iterate_spider_output(results):
+                # For each item, run any relevant subparsers to add nested information
+                if isinstance(result, Item):
+                    for subparser in parserule.subparsers:
+                        result = subparser(response, result)
+                    # Add the URL we parsed the item from
+                    result['scrape'] = {
+                        'url': self.canonicalize(response.url),
+                        'spider': self.name,
+                        'parser': parserule.parser.__name__
+                    }
+                result = self.process_result(response, result)
+                yield result
 
     def process_result(self, response, results):
         """Hook to override to modify or filter a result from any parser.
@@ -46,30 +46,30 @@ class RscPaperLoader(PaperLoader):
     """RSC-specific processing stages for various Paper fields."""
     # Convert RSC placeholder text to unicode entities
     title_in = MapCompose(fix_rsc_escapes, normalize)
-    abstract_in = MapCompose(HtmlCleaner(), fix_rsc_escapes, normalize)
+    abstract_in = MapCompose(HtmlCleaner(backend='lxml'), fix_rsc_escapes, normalize)
     # RSC BibTeX can have pages set to '-', filter this out.
     pages_out = Compose(TakeFirst(), strip_dash)
 
 
 class RscFigureLoader(FigureLoader):
     """RSC-specific processing stages for various Figure/Scheme fields."""
-    caption_in = MapCompose(HtmlCleaner(), normalize)
+    caption_in = MapCompose(HtmlCleaner(backend='lxml'), normalize)
 
 
 class RscSubstanceLoader(SubstanceLoader):
     """RSC-specific processing stages for various Substance fields."""
-    label_in = MapCompose(HtmlCleaner(), normalize)
+    label_in = MapCompose(HtmlCleaner(backend='lxml'), normalize)
 
 
 class RscTableLoader(TableLoader):
     """RSC-specific processing stages for various Table fields."""
-    caption_in = MapCompose(HtmlCleaner(), normalize)
+    caption_in = MapCompose(HtmlCleaner(backend='lxml'), normalize)
 
 
 class RscReferenceLoader(ReferenceLoader):
     """RSC-specific processing stages for various Reference fields."""
     # Additionally strip the contents of 'a' tags in citation HTML
-    citation_in = MapCompose(HtmlCleaner(banned_tags=['script', 'style', 'a']), normalize)
+    citation_in = MapCompose(HtmlCleaner(banned_tags=['script', 'style', 'a'], backend='lxml'), normalize)
 
 
 class RscSpider(GenericSpider):
@@ -79,6 +79,7 @@ class RscSpider(GenericSpider):
     # Crawl rules
     crawl = ['http://pubs\.rsc\.org/en/(content|journals)/', 'http://(xlink|feeds)\.rsc\.org/']
     ignore = ['articlepdf', 'makemyfavourite', 'federatedaccess', 'requestpermission', '/en/error/', 'coiresolver']
+    dois = ['10.1039']
     start_urls = [
         'http://pubs.rsc.org/en/content/articlehtml/2013/nr/c2nr33840h',
         'http://pubs.rsc.org/en/content/articlehtml/2014/cc/c4cc04457f',
@@ -162,7 +163,8 @@ class RscSpider(GenericSpider):
         """Scrape fulltext HTML page."""
         self.log('RSC parse_html: %s' % response.url)
         l = self.paper_loader(response=response)
-        l.add_xpath('abstract', './/p[@class="abstract"]')
+        # Pass the selected nodes rather than their extracted HTML so HtmlCleaner doesn't have to parse them again
+        l.add_value('abstract', response.xpath('.//p[@class="abstract"]'))
         l.add_loader_xpaths()
         paper = l.load_item()
         yield paper
@@ -181,7 +183,7 @@ class RscSpider(GenericSpider):
             l.add_value('number', id)
             l.add_xpath('url', './/td[@class="imgHolder"]/a/@href')
             l.add_xpath('url', './/td[@class="imgHolder"]//img/@src')
-            l.add_xpath('caption', './/span[@class="graphic_title"]')
+            l.add_value('caption', image_table.xpath('.//span[@class="graphic_title"]'))
             l.add_xpath('caption', './/td[@class="imgHolder"]//img/@alt')
             figures.append(l.load_item()) if isinstance(l.item, Figure) else schemes.append(l.load_item())
         result['figure'] = figures
@@ -195,7 +197,7 @@ class RscSpider(GenericSpider):
         for table in response.xpath('//div[@class="table_caption"]'):
             l = self.table_loader(selector=table)
             l.add_xpath('number', './b/text()')
-            l.add_xpath('caption', './span')
+            l.add_value('caption', table.xpath('./span'))
             l.add_xpath('src', './following-sibling::table')
             tables.append(l.load_item())
         result['table'] = tables
@@ -207,7 +209,7 @@ class RscSpider(GenericSpider):
         substances = []
         for substance in response.xpath('//span[@class="TC"]'):
             l = self.substance_loader(selector=substance)
-            l.add_xpath('label', './a')
+            l.add_value('label', substance.xpath('./a'))
             url = substance.xpath('./a/@href').extract()[0]
             if 'http://www.chemspider.com/Chemical-Structure.' in url:
                 l.add_value('chemspider_id', url.lstrip('http://www.chemspider.com/Chemical-Structure.').rstrip('.html'))
@@ -224,7 +226,7 @@ class RscSpider(GenericSpider):
         for cit in response.xpath('//span[starts-with(@id, "cit")]'):
             l = self.reference_loader(selector=cit)
             l.add_xpath('number', './@id', re='cit(.*)')
-            l.add_xpath('citation', '.')
+            l.add_value('citation', cit)
             l.add_xpath('doi', './a[@class="DOILink"]/@href', re='http://dx.doi.org/(.*)')
             refs.append(l.load_item())
         result['reference'] = refs
@@ -43,8 +43,7 @@ def run_tokenizer():
     inpath = find_data(os.path.join('uvvis', 'captions.txt'))
     outpath = find_data(os.path.join('uvvis', 'captions-tokens2.txt'))
     with open(inpath, 'r') as fin, open(outpath, 'w') as fout:
-        for line in fin:
-            sents = ct.tokenize(normalize(line))
+        for sents in ct.tokenize_many((normalize(line) for line in fin), workers=None, chunksize=500):
             for sent in sents:
                 fout.write(' '.join(sent).encode('utf-8'))
                 fout.write('\n')
@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 """lmtk.text - Tools for dealing with text."""
 
-import os
 import re
 import string
 import sys
 import unicodedata
 
-from lmtk.utils import find_data
+from lmtk.utils import word_list
 from lmtk.text import latex
 
 
@@ -84,25 +83,174 @@ def latex_to_unicode(text, capitalize=False):
                 res.append(c.lower())
         text = ''.join(res)
     if any(i in text for i in ['\\', '{', '}', '$', '&', '%', '#', '_']):
-        for k, v in latex.LATEX_MAPPINGS.iteritems():
-            text = text.replace(k, v)
-        for k, v in latex.LATEX_SUB_MAPPINGS.iteritems():
-            text = text.replace(k, v)
-        for mod in [u'mathbb', u'mathbf', u'mathbit', u'mathfrak', u'mathrm', u'mathscr', u'mathsf',
-                    u'mathsfbf', u'mathsfbfsl', u'mathsfsl', u'mathsl', u'mathslbb', u'mathtt']:
-            text = re.sub(ur'\\%s\{([\\\w]+)\}' % mod, ur'\1', text)
-        for k, v in latex.LATEX_SUB_SUB_MAPPINGS.iteritems():
-            text = text.replace(k, v)
-        for k, v in latex.LATEX_COMBINING_CHARS.iteritems():
-            text = re.sub(ur'%s\{?(\w)\}?' % k, ur'\1%s' % v, text)
-        text = re.sub(ur'\\noopsort\{.*?\}', ur'', text)
-        text = re.sub(ur'\\path\|(.*?)\|', ur'\1', text)
-        text = re.sub(ur'(?<!\\)[{}$]', ur'', text)
-        text = re.sub(ur'\\([{}$&_])', ur'\1', text)
+        text = _decode_latex(text)
     text = normalize(text, collapse=False)
     return text
 
 
+def _decode_latex(text):
+    """Decode LaTeX entities in a single left-to-right scan using LATEX_RE.
+
+    At each position, LATEX_MAPPINGS take priority over LATEX_SUB_MAPPINGS, then math fonts, LATEX_SUB_SUB_MAPPINGS
+    and combining characters, with the longest match chosen within each of these. The contents of a math font are
+    decoded in context with the text that follows. As before, \\noopsort and \\path are removed after decoding, so
+    they end at the first } or | in the decoded text.
+    """
+    pieces = []
+    _scan_latex(text, pieces)
+    pieces = _remove_delimited(_remove_delimited(pieces, 'noopsort', u'}'), 'path', u'|')
+    return u''.join(out for kind, raw, out in pieces)
+
+
+def _scan_latex(text, pieces, stop=None):
+    """Append a (kind, raw, out) tuple to pieces for each LaTeX entity in text and the plain text between them.
+
+    Out is the decoded text, and raw is the text that the removal of \\noopsort and \\path sees, which differs only for
+    escapes and braces as these were removed last. Kind is 'noopsort' or 'path' for the start of one of these, and None
+    otherwise.
+
+    :param stop: If given, only scan entities that start before this position. Returns the position reached.
+    """
+    end = len(text) if stop is None else stop
+    pos = 0
+    while pos < end:
+        m = LATEX_RE.search(text, pos)
+        if not m or m.start() >= end:
+            break
+        if m.start() > pos:
+            pieces.append((None, text[pos:m.start()], text[pos:m.start()]))
+        kind = m.lastgroup
+        if kind == 'font':
+            # Decode the font contents followed by the rest of the text, but only as far as the longest entity that
+            # could start within the contents, so many fonts don't each copy the rest of the text
+            arg = m.group('fontarg')
+            if text[m.end():m.end() + 1] == '{':
+                # A font name at the end of the contents could take a font argument of any length from the rest
+                after = text[m.end():]
+            else:
+                after = text[m.end():m.end() + LATEX_MAX_ENTITY]
+            pos = m.end() + _scan_latex(arg + after, pieces, stop=len(arg)) - len(arg)
+            continue
+        raw = m.group()
+        if kind == 'main':
+            out = latex.LATEX_MAPPINGS[raw]
+        elif kind == 'sub':
+            out = latex.LATEX_SUB_MAPPINGS[raw]
+        elif kind == 'subsub':
+            out = latex.LATEX_SUB_SUB_MAPPINGS[raw]
+        elif kind == 'accent':
+            out = m.group('accentarg') + LATEX_ACCENTS[m.group('accentmark')]
+        elif kind == 'escaped':
+            out = raw[1]
+        elif kind == 'brace':
+            out = u''
+        else:
+            # The start of \noopsort or \path, whose braces and delimiters are removed like any others if unterminated
+            out = raw.rstrip(u'{')
+        if kind in {'noopsort', 'path'}:
+            pieces.append((kind, raw, out))
+        elif kind in {'escaped', 'brace'}:
+            pieces.append((None, raw, out))
+        else:
+            pieces.append((None, out, out))
+        pos = m.end()
+    if pos < end:
+        pieces.append((None, text[pos:end], text[pos:end]))
+        pos = end
+    return pos
+
+
+def _remove_delimited(pieces, kind, close):
+    """Return pieces with each start of the given kind removed along with everything up to the close character.
+
+    As with `.*?` in a regex, the close character must be on the same line. For \\noopsort the contents are removed,
+    and for \\path only the delimiters are removed.
+    """
+    res = []
+    # Starts before this index have no close character before the next newline or the end
+    unclosed = 0
+    i = 0
+    while i < len(pieces):
+        if pieces[i][0] != kind:
+            res.append(pieces[i])
+            i += 1
+            continue
+        found = -1
+        if i >= unclosed:
+            for j in range(i + 1, len(pieces)):
+                raw = pieces[j][1]
+                found = raw.find(close)
+                newline = raw.find(u'\n')
+                if newline > -1 and (found < 0 or newline < found):
+                    found = -1
+                    break
+                if found > -1:
+                    break
+            else:
+                j = len(pieces)
+            if found < 0:
+                unclosed = j
+        if found < 0:
+            res.append((None, pieces[i][1], pieces[i][2]))
+            i += 1
+            continue
+        if kind == 'path':
+            res.extend(pieces[i + 1:j])
+            res.append((None, pieces[j][1][:found], pieces[j][1][:found]))
+        rest = pieces[j][1][found + 1:]
+        res.append((None, rest, rest))
+        i = j + 1
+    return res
+
+
+def trie_pattern(words, ignorecase=False, fragments=None):
+    """Return a regular expression pattern that matches any of the given words, with shared prefixes factored out.
+
+    With a plain alternation of words, the regex engine tries every word in turn at each position. With the words in a
+    trie, it only follows the branch that matches. Where several words match at the same position, the longest is tried
+    first. Branches that continue in the same way are merged into a character class, so ['.ca', '.cd', '.co'] gives
+    '\\.c[ado]'.
+
+    :param words: An iterable of words to match. Characters are escaped.
+    :param ignorecase: Whether to merge words that only differ in case. The pattern must be compiled with re.I.
+    :param fragments: A dict of characters to the pattern to use for them instead, e.g. {' ': r'\\s?'}.
+
+    """
+    fragments = fragments or {}
+    trie = {}
+    for word in words:
+        node = trie
+        for c in (word.lower() if ignorecase else word):
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def charclass(chars):
+        return re.escape(chars[0]) if len(chars) == 1 else '[%s]' % ''.join(re.escape(c) for c in chars)
+
+    def build(node):
+        # Each branch is (start, rest), where start is a fragment or a list of characters that share the same rest
+        branches = []
+        classes = {}
+        for c, child in sorted(node.items()):
+            if not c:
+                continue
+            rest = build(child)
+            if c in fragments:
+                branches.append((fragments[c], rest))
+            elif rest in classes:
+                classes[rest].append(c)
+            else:
+                classes[rest] = [c]
+                branches.append((classes[rest], rest))
+        alts = [(charclass(start) if isinstance(start, list) else start) + rest for start, rest in branches]
+        if not alts:
+            return ''
+        pattern = alts[0] if len(alts) == 1 else '(?:%s)' % '|'.join(alts)
+        return '(?:%s)?' % pattern if '' in node else pattern
+
+    return build(trie)
+
+
 def normalize(text, form='NFKC', collapse=True):
     """Normalize unicode, hyphens, whitespace.
 
@@ -118,29 +266,21 @@ def normalize(text, form='NFKC', collapse=True):
     # Normalize to canonical unicode (using NKFC by default)
     text = unicodedata.normalize(form, u(text))
 
-    # Strip out any control characters (they occasionally creep in somehow)
-    for control in CONTROLS:
-        text = text.replace(control, u'')
-
-    # Normalize hyphens (unify all dash, minus and hyphen characters, remove soft hyphens)
-    for hyphen in HYPHENS:
-        text = text.replace(hyphen, u'-')
-    text = text.replace(u'\u00AD', u'')
-
-    # Normalize separate double quotes
-    text = text.replace(u'"‘', u'“').replace(u'’\'', u'”').replace(u'\'\'', u'”').replace(u'``', u'“')
+    # Strip out control characters (they occasionally creep in somehow), unify all dash, minus and hyphen characters,
+    # remove soft hyphens and normalize separate double quotes
+    for old, new in NORMALIZE_REPLACEMENTS:
+        text = text.replace(old, new)
     # Possible further normalization to ascii:
     # \u201c \u201d -> \u0022
     # \u2018 \u2019 \u0060 \u00b4 -> \u0027
 
-    # Normalize unusual whitespace not caught by unicodedata
-    text = text.replace(u'\u000B', u' ').replace(u'\u000C', u' ').replace(u'\u0085', ' ')
-    text = text.replace(u'\u2028', u'\n').replace(u'\u2029', u'\n').replace('\r\n', '\n').replace('\r', '\n')
     if collapse:
+        # Unusual whitespace and newlines are all collapsed by split, so there is no need to normalize them first
         text = ' '.join(text.split())
     else:
-        # TODO: If not collapse, just normalize newlines to '\n'
-        pass
+        # Normalize unusual whitespace not caught by unicodedata
+        for old, new in WHITESPACE_REPLACEMENTS:
+            text = text.replace(old, new)
     return text
 
 
@@ -165,7 +305,7 @@ def dequirk_string(text):
     return text
 
 
-def levenshtein(s1, s2, allow_substring=False):
+def levenshtein(s1, s2, allow_substring=False, max_distance=None):
     """Return the Levenshtein distance between two strings.
 
     The Levenshtein distance (a.k.a "edit difference") is the number of characters that need to be substituted,
@@ -174,26 +314,95 @@ def levenshtein(s1, s2, allow_substring=False):
     Setting the `allow_substring` parameter to True allows s1 to be a
     substring of s2, so that, for example, "hello" and "hello there" would have a distance of zero.
 
+    If `max_distance` is given, the calculation stops as soon as the distance is certain to exceed it, and
+    max_distance + 1 is returned instead of the exact distance.
+
     :param s1: The first string
     :param s2: The second string
     :param allow_substring: Whether to allow s1 to be a substring of s2
+    :param max_distance: The maximum distance of interest
     :type s1: str
     :type s2: str
     :type allow_substring: bool
+    :type max_distance: int
     :rtype int
     """
-    len1, len2 = len(s1), len(s2)
-    lev = []
-    for i in range(len1 + 1):
-        lev.append([0] * (len2 + 1))
-    for i in range(len1 + 1):
-        lev[i][0] = i
-    for j in range(len2 + 1):
-        lev[0][j] = 0 if allow_substring else j
-    for i in range(len1):
-        for j in range(len2):
-            lev[i + 1][j + 1] = min(lev[i][j + 1] + 1, lev[i + 1][j] + 1, lev[i][j] + (s1[i] != s2[j]))
-    return min(lev[len1]) if allow_substring else lev[len1][len2]
+    return _levenshtein(_char_masks(s1), len(s1), s2, allow_substring, max_distance)
+
+
+def levenshtein_many(query, candidates, max_distance, allow_substring=False):
+    """Return a list of (candidate, distance) tuples for the candidates within max_distance of query.
+
+    This is faster than calling `levenshtein` for each candidate because the query is only preprocessed once.
+
+    :param query: The string to compare against every candidate, which is s1 when using `allow_substring`
+    :param candidates: An iterable of strings
+    :param max_distance: The maximum distance for a candidate to be included
+    :param allow_substring: Whether to allow query to be a substring of the candidates
+    :rtype list
+    """
+    masks, m = _char_masks(query), len(query)
+    matches = []
+    for candidate in candidates:
+        distance = _levenshtein(masks, m, candidate, allow_substring, max_distance)
+        if distance <= max_distance:
+            matches.append((candidate, distance))
+    return matches
+
+
+def _char_masks(s):
+    """Return a dict mapping each character in s to a bit mask of the positions it occurs at."""
+    masks = {}
+    for i, c in enumerate(s):
+        masks[c] = masks.get(c, 0) | 1 << i
+    return masks
+
+
+def _levenshtein(masks, m, s2, allow_substring, max_distance):
+    """Calculate Levenshtein distance using the bit-parallel algorithm of Myers (1999), as formulated by Hyyrö (2001).
+
+    Each column of the edit distance matrix is represented by bit vectors of the vertical +1 and -1 differences, so a
+    whole column is computed in a few integer operations. Python integers have unlimited size, so s1 can be any length.
+
+    :param masks: Character position bit masks for s1, from `_char_masks`
+    :param m: The length of s1
+    """
+    n = len(s2)
+    cutoff = max_distance + 1 if max_distance is not None else None
+    if not m:
+        return 0 if allow_substring else min(n, cutoff) if cutoff is not None else n
+    if cutoff is not None and not allow_substring and abs(m - n) >= cutoff:
+        return cutoff
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv = full, 0
+    score = best = m
+    for j, c in enumerate(s2):
+        eq = masks.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv) & full
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        if allow_substring:
+            # The first row is all zero, so s1 can start anywhere in s2
+            ph = ph << 1 & full
+            best = min(best, score)
+            if not best:
+                return 0
+        else:
+            ph = (ph << 1 | 1) & full
+            # Each remaining column can reduce the distance by at most one
+            if cutoff is not None and score - (n - j - 1) >= cutoff:
+                return cutoff
+        mh = mh << 1 & full
+        pv = mh | ~(xv | ph) & full
+        mv = ph & xv
+    distance = best if allow_substring else score
+    return min(distance, cutoff) if cutoff is not None else distance
 
 
 class Unhyphenator:
@@ -205,10 +414,18 @@ class Unhyphenator:
         :param joins: A list words that are acceptable to form by joining two components.
 
         """
-        self.joins = joins
-        if joins is None:
-            with open(find_data(os.path.join('words', 'hyphen_joins.txt')), 'r') as jf:
-                self.joins = set(word.strip().lower() for word in jf)
+        self._joins = joins
+
+    @property
+    def joins(self):
+        """The set of acceptable joined words. Defaults to the shared hyphen_joins word list, loaded on first use."""
+        if self._joins is None:
+            self._joins = word_list('hyphen_joins', lower=True)
+        return self._joins
+
+    @joins.setter
+    def joins(self, joins):
+        self._joins = joins
 
     def unhyphenate(self, part1, part2):
         """Given two word components, return a string with them joined appropriately."""
@@ -349,7 +566,43 @@ TLDS = {
 }
 
 URL_START_RE = re.compile(r'^(https?://.+?|www\..+?\..+?)', re.I)
-URL_END_RE = re.compile(r'(%s)(\/|:|$)' % '|'.join(TLDS), re.I)
+URL_END_RE = re.compile(r'(%s)(\/|:|$)' % trie_pattern(TLDS, ignorecase=True), re.I)
 EMAIL_RE = re.compile(r'([\w\-\.\+%]+@(\w[\w\-]+\.)+[\w\-]+)', re.I)
 DOI_RE = re.compile(r'^10\.\d{4,}(?:\.\d+)*/\S+$', re.U)
 ISSN_RE = re.compile(r'^[A-Za-z0-9]{4}-[A-Za-z0-9]{4}$')
+
+#: Ordered (old, new) substitutions applied by `normalize`, built once from CONTROLS and HYPHENS.
+NORMALIZE_REPLACEMENTS = tuple(
+    [(control, u'') for control in sorted(CONTROLS)] +
+    [(hyphen, u'-') for hyphen in sorted(HYPHENS - {u'-'})] +
+    [(u'\u00AD', u''), (u'"‘', u'“'), (u'’\'', u'”'), (u'\'\'', u'”'), (u'``', u'“')]
+)
+
+#: Ordered (old, new) substitutions applied by `normalize` when not collapsing whitespace.
+WHITESPACE_REPLACEMENTS = (
+    (u'\u000B', u' '), (u'\u000C', u' '), (u'\u0085', u' '), (u'\u2028', u'\n'), (u'\u2029', u'\n'),
+    (u'\r\n', u'\n'), (u'\r', u'\n')
+)
+
+#: Map the literal LaTeX for each combining character to the unicode combining character.
+LATEX_ACCENTS = dict((re.sub(r'\\(.)', r'\1', k), v) for k, v in latex.LATEX_COMBINING_CHARS.iteritems())
+
+#: A single regular expression that finds all the LaTeX entities decoded by `latex_to_unicode`, in priority order.
+LATEX_RE = re.compile(
+    ur'(?P<main>%s)|(?P<sub>%s)|(?P<font>\\(?:%s)\{(?P<fontarg>[\\\w]+)\})|(?P<subsub>%s)|'
+    ur'(?P<accent>(?P<accentmark>%s)\{?(?P<accentarg>\w)\}?)|(?P<noopsort>\\noopsort\{)|(?P<path>\\path\|)|'
+    ur'(?P<escaped>\\[{}$&_])|(?P<brace>[{}$])' % (
+        trie_pattern(latex.LATEX_MAPPINGS),
+        trie_pattern(latex.LATEX_SUB_MAPPINGS),
+        '|'.join(['mathbb', 'mathbf', 'mathbit', 'mathfrak', 'mathrm', 'mathscr', 'mathsf', 'mathsfbf', 'mathsfbfsl',
+                  'mathsfsl', 'mathsl', 'mathslbb', 'mathtt']),
+        trie_pattern(latex.LATEX_SUB_SUB_MAPPINGS),
+        '|'.join(re.escape(k) for k in sorted(LATEX_ACCENTS, key=len, reverse=True))
+    )
+)
+
+#: The length of the longest match of LATEX_RE, apart from math fonts, whose contents can be any length.
+LATEX_MAX_ENTITY = max(
+    [len(k) for t in (latex.LATEX_MAPPINGS, latex.LATEX_SUB_MAPPINGS, latex.LATEX_SUB_SUB_MAPPINGS) for k in t] +
+    [len(k) + 3 for k in LATEX_ACCENTS] + [len('\\noopsort{')]
+)
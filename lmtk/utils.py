@@ -6,10 +6,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 import functools
+import io
 import logging
+import mmap
 import os
 import re
 import subprocess
+import threading
 
 from lmtk.store import config
 
@@ -41,6 +44,45 @@ def memoized_property(fget):
     return property(fget_memoized)
 
 
+class shared_property(object):
+    """Decorator to create a class property that is computed on first access and then shared by all instances.
+
+    The decorated method is passed the class rather than an instance. The result replaces the property on the class, so
+    it is only computed once per process. Setting the attribute on an instance overrides it for that instance only.
+    """
+
+    def __init__(self, fget):
+        self.fget = fget
+        functools.update_wrapper(self, fget)
+
+    def __get__(self, instance, owner):
+        value = self.fget(owner)
+        setattr(owner, self.fget.__name__, value)
+        return value
+
+
+class per_class_property(object):
+    """Decorator to create a class property that is computed on first access for each class, and then shared by all
+    instances of that class.
+
+    Unlike `shared_property`, a subclass never inherits the value computed for its base class, so this suits values
+    derived from class attributes that a subclass may override. Setting the attribute on an instance overrides it for
+    that instance only.
+    """
+
+    def __init__(self, fget):
+        self.fget = fget
+        self.values = {}
+        functools.update_wrapper(self, fget)
+
+    def __get__(self, instance, owner):
+        try:
+            return self.values[owner]
+        except KeyError:
+            value = self.values[owner] = self.fget(owner)
+            return value
+
+
 def find_file(name=None, env_vars=(), searchpath=(), executable=False):
     """Search for a file.
 
@@ -151,3 +193,98 @@ def find_data(path):
     return os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', path)
 
 
+
+class SortedWordList(object):
+    """A word list backed by a memory-mapped file of sorted UTF-8 lines, supporting membership tests by binary search.
+
+    The file is shared between processes by the operating system, so it costs no memory per process and nothing to load.
+    Iterating gives the words in sorted order.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._len = None
+
+    def __len__(self):
+        if self._len is None:
+            m = self._mmap
+            # Count newlines a chunk at a time, so the whole file is never copied into memory at once
+            newlines = sum(m[i:i + 1048576].count(b'\n') for i in range(0, len(m), 1048576))
+            self._len = newlines + 1 if len(m) and m[-1:] != b'\n' else newlines
+        return self._len
+
+    def __iter__(self):
+        m = self._mmap
+        start = 0
+        while start < len(m):
+            end = m.find(b'\n', start)
+            end = len(m) if end == -1 else end
+            yield m[start:end].decode('utf-8')
+            start = end + 1
+
+    def __contains__(self, word):
+        target = word.encode('utf-8')
+        m = self._mmap
+        lo, hi = 0, len(m)
+        # lo and hi are always at the start of a line
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = m.rfind(b'\n', lo, mid) + 1 or lo
+            end = m.find(b'\n', start, hi)
+            end = hi if end == -1 else end
+            line = m[start:end]
+            if line == target:
+                return True
+            elif line < target:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+
+_word_lists = {}
+_word_lists_lock = threading.Lock()
+
+
+def _word_list_paths(name, lower):
+    """Return the paths to the text and sorted versions of a word list."""
+    base = find_data(os.path.join('words', name))
+    return '%s.txt' % base, '%s%s.sorted' % (base, '.lower' if lower else '')
+
+
+def word_list(name, lower=False):
+    """Return the words in a data word list, loading it on first use and sharing it thereafter.
+
+    If a sorted version has been built with `build_sorted_word_list`, it is memory-mapped instead of loading the text
+    file into a frozenset.
+
+    :param name: The name of the word list in the data/words directory, without extension.
+    :param lower: Whether to lowercase the words.
+
+    """
+    key = (name, lower)
+    if key not in _word_lists:
+        with _word_lists_lock:
+            if key not in _word_lists:
+                txt_path, sorted_path = _word_list_paths(name, lower)
+                if os.path.isfile(sorted_path) and os.path.getsize(sorted_path):
+                    _word_lists[key] = SortedWordList(sorted_path)
+                else:
+                    with io.open(txt_path, encoding='utf-8') as f:
+                        _word_lists[key] = frozenset(word.strip().lower() if lower else word.strip() for word in f)
+    return _word_lists[key]
+
+
+def build_sorted_word_list(name, lower=False):
+    """Build the sorted version of a word list, to be memory-mapped by `word_list`.
+
+    :param name: The name of the word list in the data/words directory, without extension.
+    :param lower: Whether to lowercase the words.
+
+    """
+    txt_path, sorted_path = _word_list_paths(name, lower)
+    with io.open(txt_path, encoding='utf-8') as f:
+        words = set((word.strip().lower() if lower else word.strip()).encode('utf-8') for word in f)
+    with open(sorted_path, 'wb') as f:
+        f.write(b'\n'.join(sorted(words)))
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
-from setuptools import setup
+from setuptools import setup, find_packages
 
 
 if os.path.exists('README.rst'):
@@ -17,7 +17,7 @@ setup(
     author_email='m.swain@me.com',
     license='MIT',
     url='https://github.com/mcs07/lmtk',
-    packages=['lmtk'],
+    packages=find_packages(exclude=['tests']),
     description='Literature Mining Toolkit',
     long_description=long_description,
     keywords='text-mining mining html science scientific',
@@ -25,6 +25,7 @@ setup(
     test_suite='tests',
     install_requires=['requests', 'six', 'beautifulsoup4', 'lxml', 'Scrapy'],
     package_data={'lmtk': ['data/words/*.txt']},
+    entry_points={'console_scripts': ['lmtk-bib2jsonl = lmtk.bib.bib2jsonl:main']},
     classifiers=[
         'Intended Audience :: Developers',
         'Intended Audience :: Science/Research',
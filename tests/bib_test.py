@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 """Unit tests for bib package."""
 
+import io
+import os
+import shutil
+import tempfile
 import unittest
 
-from lmtk.bib import BibtexParser, PersonName
+from lmtk.bib import BibtexParser, PersonName, NameCache, TitleIndex, parse_bibtex, iterparse_bibtex_parallel
 
 
 class TestBibtexParser(unittest.TestCase):
@@ -82,6 +86,35 @@ url  ="http://dx.doi.org/10.1039/C3RA40330K"}
         bib.parse()
         self.assertEqual(self.bib2a, bib.records_list[0])
 
+    def test_iter_records(self):
+        """Test incremental parsing from a file object with records and definitions split across chunks."""
+        data = '@string{rsc = "The Royal Society of Chemistry"}\n' + self.bib1.replace('"The Royal Society of Chemistry"', 'rsc') + self.bib2
+        for chunksize in [1, 7, 64, 65536]:
+            bib = BibtexParser()
+            records = list(bib.iter_records(io.BytesIO(data.encode('utf-8')), chunksize=chunksize))
+            self.assertEqual([self.bib1a, self.bib2a], records)
+            self.assertEqual({}, bib.records)
+
+    def test_iter_records_multibyte(self):
+        """Test multi-byte characters split across chunk boundaries are decoded."""
+        data = u'@misc{a, title = "Schr\xf6dinger \u2013 \u03b1-helix"}'
+        bib = BibtexParser()
+        records = list(bib.iter_records(io.BytesIO(data.encode('utf-8')), chunksize=1))
+        self.assertEqual([{u'id': u'a', u'type': u'misc', u'title': u'Schr\xf6dinger - \u03b1-helix'}], records)
+
+    def test_parallel(self):
+        """Test parallel parsing gives the same records in the same order as parse_bibtex."""
+        data = ('@string{rsc = "The Royal Society of Chemistry"}\n' + self.bib1.replace('"The Royal Society of Chemistry"', 'rsc') +
+                '@comment{C3RA40330K}\n@string{rsc = "RSC"}\n' + self.bib2.replace('"The Royal Society of Chemistry"', 'rsc') +
+                self.bib1.replace('"CrystEngComm"', '"CrystEngComm 2"') + '@misc{partial, title = "A @ b"')
+        expected = parse_bibtex(data)
+        self.assertEqual(3, len(expected))
+        self.assertEqual(u'RSC', expected[1][u'publisher'])
+        self.assertEqual(u'CrystEngComm 2', expected[0][u'journal'])
+        for batchsize in [1, 2, 100]:
+            self.assertEqual(expected, list(iterparse_bibtex_parallel(data, workers=1, batchsize=batchsize)))
+        self.assertEqual(expected, list(iterparse_bibtex_parallel(data, workers=2, batchsize=1)))
+
     def test_parse_names(self):
         res = [{u'lastname': u'van Linder', u'name': u'Bernd van Linder', u'firstname': u'Bernd'},
                {u'lastname': u'Meyer', u'name': u'John-Jules Ch Meyer', u'firstname': u'John-Jules Ch'},
@@ -203,6 +236,62 @@ class TestPersonName(unittest.TestCase):
         self.assertFalse(PersonName(u'Oscar Bluth').could_be(PersonName(u'George Oscar Bluth')))
         self.assertTrue(PersonName(u'J F K').could_be(PersonName(u'John Fitzgerald "Jack" Kennedy')))
 
+    def test_cache(self):
+        original, PersonName.cache = PersonName.cache, NameCache(maxsize=2)
+        try:
+            p = PersonName(u'von Beethoven, Ludwig')
+            self.assertEqual((0, 1), (PersonName.cache.hits, PersonName.cache.misses))
+            # Mutating a result must not affect later cache hits
+            p[u'firstname'] = u'Changed'
+            q = PersonName(u'von Beethoven, Ludwig')
+            self.assertEqual((1, 1), (PersonName.cache.hits, PersonName.cache.misses))
+            self.assertEqual(u'Ludwig', q[u'firstname'])
+            self.assertEqual(PersonName.cache.get((u'von Beethoven, Ludwig', False)), q)
+            # Keyed on from_bibtex too
+            PersonName(u'von Beethoven, Ludwig', from_bibtex=True)
+            self.assertEqual(2, PersonName.cache.misses)
+            PersonName(u'Henry Ford')
+            self.assertEqual(2, len(PersonName.cache))
+        finally:
+            PersonName.cache = original
+
+
+class TestTitleIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TitleIndex()
+        self.index.add(1, u'Polymorphism of glycine-glutaric acid co-crystals')
+        self.index.add(2, u'Self-metathesis of fatty acid methyl esters')
+        self.index.add(3, u'Cat')
+
+    def test_query(self):
+        self.assertEqual([(1, 0)], self.index.query(u'Polymorphism of Glycine-Glutaric Acid Co-Crystals', 2))
+        self.assertEqual([(1, 2)], self.index.query(u'Polymorphism of glycine glutaric acid cocrystals', 2))
+        self.assertEqual([], self.index.query(u'Polymorphism of glycine glutaric acid cocrystals', 1))
+        self.assertEqual({2}, self.index.candidates(u'Self-metathesis of fatty acid ethyl esters', 2))
+        # Short titles with no n-grams guaranteed in common
+        self.assertEqual([(3, 1)], self.index.query(u'Bat', 1))
+
+    def test_add_remove(self):
+        self.index.add(2, u'Something else entirely')
+        self.assertEqual([], self.index.query(u'Self-metathesis of fatty acid methyl esters', 5))
+        self.index.add(4, u'Self-metathesis of fatty acid methyl ester')
+        self.assertEqual([(4, 1)], self.index.query(u'Self-metathesis of fatty acid methyl esters', 1))
+        self.index.remove(4)
+        self.assertEqual(3, len(self.index))
+        self.assertEqual([], self.index.query(u'Self-metathesis of fatty acid methyl esters', 1))
+
+    def test_pickle(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'titles.pickle')
+            self.index.save(path)
+            index = TitleIndex.load(path)
+            self.assertEqual(3, len(index))
+            self.assertEqual([(1, 2)], index.query(u'Polymorphism of glycine glutaric acid cocrystals', 2))
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
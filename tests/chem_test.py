@@ -4,7 +4,8 @@
 
 import unittest
 
-from lmtk.chem import normalize, SOLVENT_RE, ChemTokenizer, INCHI_RE, SMILES_RE
+from lmtk.chem import normalize, SOLVENT_RE, ChemTokenizer, SubtokenCache, INCHI_RE, SMILES_RE, is_inchi, is_smiles, \
+    extract_identifiers
 
 
 class TestNormalization(unittest.TestCase):
@@ -27,6 +28,9 @@ class TestNormalization(unittest.TestCase):
         self.assertEqual(u'and ≈90 °', normalize(u'and ≈90°'))
         self.assertEqual(u'of 25 μM,', normalize(u'of 25μM,'))
         self.assertEqual(u'at angles α 0-45 °.', normalize(u'at angles α 0-45° .'))
+        self.assertEqual(u'at pH 7.4 and 25 °C', normalize(u'at pH7.4 and 25° C'))
+        self.assertEqual(u'pH 7.5 %, pH 7%', normalize(u'pH7.5%, pH7%'))
+        self.assertEqual(u'5 mg/3 s', normalize(u'5mg/3s'))
 
     def test_nonquantities(self):
         self.assertEqual(u'(C2H5)4N', normalize(u'(C2H5)4N'))
@@ -55,6 +59,7 @@ class TestRegex(unittest.TestCase):
         self.assertEqual([u'Ethyl acetate', u'Diethyl ether'], SOLVENT_RE.findall(u'Ethyl acetate. Diethyl ether.'))
         self.assertEqual([u'Ethylacetate', u'Diethylether'], SOLVENT_RE.findall(u'Ethylacetate. Diethylether.'))
         self.assertEqual([], SOLVENT_RE.findall(u'[Rh2(dihex)4]2+'))
+        self.assertEqual([u'phosphate buffered saline'], SOLVENT_RE.findall(u'In phosphate buffered saline.'))
 
     def test_inchi(self):
         """Test InChI regex."""
@@ -123,6 +128,36 @@ class TestRegex(unittest.TestCase):
         self.assertTrue(SMILES_RE.match(u'CCCC#N'))
         self.assertTrue(SMILES_RE.match(u'C(/C=C\O)Cl'))
 
+    def test_is_inchi(self):
+        """Test linear-time InChI validator."""
+        self.assertTrue(is_inchi(u'InChI=1S/C2H4ClNO2/c3-1(4)2(5)6/h1H,4H2,(H,5,6)/p+1/t1-/m1/s1'))
+        self.assertTrue(is_inchi(u'InChI=1S/H2O4S/c1-5(2,3)4/h(H2,1,2,3,4)/i/hD2'))
+        self.assertTrue(is_inchi(u'InChI=1S/p+1/i/hD'))
+        self.assertFalse(is_inchi(u'InChI=1S'))
+        self.assertFalse(is_inchi(u'InChI=1S/C7H12O/h6-7H,1-5H2/c8-6-7-4-2-1-3-5-7'))
+        self.assertFalse(is_inchi(u'InChI=1S/C8H6Cl4/c1-3(2)4-5(9)7(11)8(12)6(4)10/h1-2H3)'))
+
+    def test_is_smiles(self):
+        """Test linear-time SMILES validator."""
+        self.assertTrue(is_smiles(u'CC1=C(SC=N1)C=CC2=C(NC(SC2)C(C(=O)O)NC(=O)C(=NOC)C3=CSC(=N3)N)C(=O)O'))
+        self.assertTrue(is_smiles(u'C[N+](C)(C)CCCCCC[N+](C)(C)C.[Br-]'))
+        self.assertTrue(is_smiles(u'C%12CC%12'))
+        self.assertTrue(is_smiles(u'[HH]'))
+        self.assertFalse(is_smiles(u'C1CC'))
+        self.assertFalse(is_smiles(u'Cl2'))
+        self.assertFalse(is_smiles(u'CC(=O'))
+        self.assertFalse(is_smiles(u'C)C('))
+        self.assertFalse(is_smiles(u'[Xx]'))
+        self.assertFalse(is_smiles(u'C' * 5000 + u'X'))
+
+    def test_extract_identifiers(self):
+        """Test extraction of typed identifiers with offsets."""
+        s = u'Ethanol InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3 LFQSCWFLJHTTHZ-UHFFFAOYSA-N is CCO, CAS 64-17-5 (not C1CC).'
+        self.assertEqual([(u'inchi', u'InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3', 8, 41),
+                          (u'inchikey', u'LFQSCWFLJHTTHZ-UHFFFAOYSA-N', 42, 69),
+                          (u'cas', u'64-17-5', 82, 89)], extract_identifiers(s))
+        self.assertEqual([(u'smiles', u'OC(=O)C1CCCC1', 4, 17)], extract_identifiers(u'The OC(=O)C1CCCC1 acid'))
+
 
 class TestChemTokenizer(unittest.TestCase):
     """Test ChemTokenizer.
@@ -136,6 +171,71 @@ class TestChemTokenizer(unittest.TestCase):
     def setUp(self):
         self.t = ChemTokenizer()
 
+    def test_tokenize_many(self):
+        sentences = [u'The quick brown fox jumps over the lazy dog', u'', u'Dissolved in CH2Cl2 (5 mL) at 25°C.',
+                     u'On a $50,000 mortgage of 30 years at 8 percent.'] * 5
+        expected = [self.t.tokenize(s) for s in sentences]
+        self.assertEqual(expected, list(self.t.tokenize_many(sentences)))
+        self.assertEqual(expected, list(self.t.tokenize_many(iter(sentences), workers=2, chunksize=3)))
+        self.assertEqual([], list(self.t.tokenize_many([], workers=2)))
+
+    def test_span_tokenize(self):
+        s = u'Add 5 mL  ethanol:water. Then\nheat (to 60 °C).'
+        spans = self.t.span_tokenize(s)
+        self.assertEqual([[(0, 3), (4, 5), (6, 8), (10, 17), (17, 18), (18, 23), (23, 24)],
+                          [(25, 29), (30, 34), (35, 36), (36, 38), (39, 41), (42, 43), (43, 44), (44, 45), (45, 46)]], spans)
+        self.assertEqual(self.t.tokenize(s), [[s[start:end] for start, end in sentence] for sentence in spans])
+        # Merged inline elements keep their original whitespace
+        s = u'with Ru(III)[<strong>9b  and 10b</strong>] (<strong>ref. 34</strong>)'
+        self.assertEqual([u'with', u'Ru(III)[<strong>9b  and 10b</strong>]', u'(', u'<strong>ref. 34</strong>', u')'],
+                         [s[start:end] for start, end in self.t.span_tokenize(s)[0]])
+
+    def test_rule_hits(self):
+        t = ChemTokenizer()
+        self.assertEqual([[u'(', u'ethanol', u':', u'water', u')', u'at', u'5', u'mL', u'.']],
+                         t.tokenize(u'(ethanol:water) at 5mL.'))
+        self.assertEqual({'openparen': 1, 'closeparen': 1, 'colon': 1, 'quantity': 1, 'fullstop': 1}, t.rule_hits)
+
+    def test_cache(self):
+        t = ChemTokenizer()
+        t.cache = SubtokenCache()
+        s = u'E. coli in solution. E. Then (solution).'
+        expected = [[u'E.', u'coli', u'in', u'solution', u'.'], [u'E', u'.'], [u'Then', u'(', u'solution', u')', u'.']]
+        self.assertEqual(expected, t.tokenize(s))
+        self.assertEqual(expected, t.tokenize(s))
+        self.assertTrue(t.cache.hit_rate > 0.5)
+        t.cache = SubtokenCache(maxsize=2)
+        self.assertEqual(expected, t.tokenize(s))
+        self.assertTrue(len(t.cache) <= 4)
+        t.cache = None
+        self.assertEqual(expected, t.tokenize(s))
+
+    def test_cache_overrides(self):
+        """Test instances and subclasses that override attributes don't use splits cached by the base class."""
+        class FooBarTokenizer(ChemTokenizer):
+            hyphensplits = frozenset([u'foo bar'])
+
+        s = u'a foo-bar b'
+        self.assertEqual([[u'a', u'foo-bar', u'b']], ChemTokenizer().tokenize(s))
+        t = ChemTokenizer()
+        t.hyphensplits = frozenset([u'foo bar'])
+        self.assertEqual([[u'a', u'foo', u'-', u'bar', u'b']], t.tokenize(s))
+        self.assertIsNot(ChemTokenizer.cache, t.cache)
+        self.assertEqual([[u'a', u'foo', u'-', u'bar', u'b']], FooBarTokenizer().tokenize(s))
+        self.assertEqual([[u'a', u'foo-bar', u'b']], ChemTokenizer().tokenize(s))
+        self.assertIs(ChemTokenizer().cache, ChemTokenizer.cache)
+
+    def test_subclass_rules(self):
+        """Test a subclass with different rules uses its own rule table rather than the base class table."""
+        class NoParenTokenizer(ChemTokenizer):
+            cache = None
+            rules = tuple(rule for rule in ChemTokenizer.rules if rule[0] not in {'openparen', 'closeparen'})
+
+        s = u'(ethanol) at 5mL'
+        self.assertEqual([[u'(', u'ethanol', u')', u'at', u'5', u'mL']], ChemTokenizer().tokenize(s))
+        self.assertEqual([[u'(ethanol)', u'at', u'5', u'mL']], NoParenTokenizer().tokenize(s))
+        self.assertEqual([[u'(', u'ethanol', u')', u'at', u'5', u'mL']], ChemTokenizer().tokenize(s))
+
     def test_sentence(self):
         self.assertEqual([[u'The', u'quick', u'brown', u'fox', u'jumps', u'over',  u'the', u'lazy', u'dog']],
                          self.t.tokenize(u'The quick brown fox jumps over the lazy dog'))
@@ -268,6 +368,9 @@ class TestChemTokenizer(unittest.TestCase):
                          self.t.tokenize(normalize(u'L<strong>a</strong> from <strong>ref. 72</strong>.')))
         self.assertEqual([[u'with', u'Ru(III)[<strong>9b and 10b</strong>]', u'(', u'<strong>ref. 34</strong>', u')']],
                          self.t.tokenize(normalize(u'with Ru(III)[<strong>9b and 10b</strong>] (<strong>ref. 34</strong>)')))
+        self.assertEqual([[u'see', u'<i>a b c</i>']], self.t.tokenize(u'see <i>a b c</i>'))
+        self.assertEqual([[u'x', u'<b>ref. 1</b>', u'and', u'<i>E. coli</i>', u'strain']],
+                         self.t.tokenize(u'x <b>ref. 1</b> and <i>E. coli</i> strain'))
 
     def test_colon(self):
         self.assertEqual([[u'ethanol', u':', u'water']], self.t.tokenize(u'ethanol:water'))
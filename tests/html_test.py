@@ -4,7 +4,9 @@
 
 import unittest
 
-from lmtk.html import HtmlCleaner
+from lxml import etree
+
+from lmtk.html import HtmlCleaner, extract_metadata
 
 
 class TestClean(unittest.TestCase):
@@ -33,6 +35,81 @@ class TestClean(unittest.TestCase):
         self.assertEqual(self.C1B, clean2(self.D1))
         self.assertEqual(self.C2, clean3(self.D2))
 
+    def test_clean_html_lxml(self):
+        """Test clean_html function with the lxml backend."""
+        clean1 = HtmlCleaner(allowed_tags=['a', 'strong'], allowed_attrs=['href'], backend='lxml')
+        clean2 = HtmlCleaner(allowed_tags=['a', 'strong'], backend='lxml')
+        clean3 = HtmlCleaner(backend='lxml')
+        self.assertEqual(self.C1A, clean1(self.D1))
+        self.assertEqual(self.C1B, clean2(self.D1))
+        self.assertEqual(self.C2, clean3(self.D2))
+        for empty in ['', ' ', '\n', '<!-- comment -->']:
+            self.assertEqual(u'', clean3(empty))
+        self.assertEqual(u'a<br/>b', HtmlCleaner(allowed_tags=['br'], backend='lxml')('<p>a<br>b</p>'))
+
+        class BoldCleaner(HtmlCleaner):
+            def allowed(self, tag):
+                return tag.name in {'b', 'strong'}
+
+            def transform(self, tag):
+                tag.name = 'b'
+                tag.attrs = {}
+
+        self.assertEqual(u'This iss a <b>test</b>. Test link', BoldCleaner(backend='lxml')(self.D1).split('\n')[-1])
+
+    def test_clean_element(self):
+        """Test cleaning already parsed lxml elements."""
+        root = etree.fromstring(self.D1, etree.HTMLParser())
+        p = root.find('.//p')
+        for backend in ['bs4', 'lxml']:
+            clean = HtmlCleaner(allowed_tags=['a', 'strong'], allowed_attrs=['href'], backend=backend)
+            self.assertEqual(self.C1A, clean(root))
+            self.assertEqual(u'This iss a <strong>test</strong>. Test <a href="link">link</a>', clean(p))
+        # The tree is left unchanged
+        self.assertEqual(u'link', p.find('a').get('href'))
+        clean = HtmlCleaner(backend='lxml')
+        # The shared parser can still be used after empty input
+        self.assertEqual([self.C2, u'This iss a test. Test link', u'', self.C2],
+                         clean.clean_many([self.D2, p, '', self.D2]))
+
+
+class TestMeta(unittest.TestCase):
+
+    D1 = '''
+        <html>
+            <head>
+                <title>Page title</title>
+                <meta name="DC.title" content="Dublin core title">
+                <meta name="citation_title" content=" Citation title ">
+                <meta name="citation_author" content="Smith, John">
+                <meta name="citation_author" content="Doe, Jane">
+                <meta name="citation_firstpage" content="12">
+                <meta name="citation_lastpage" content="15">
+                <meta name="citation_keywords" content="crystals, polymorphism">
+                <meta name="DC.Rights" content="CC-BY">
+                <link rel="alternate" type="application/pdf" href="paper.pdf">
+                <link rel="alternate" type="text/xml" href="paper.xml">
+            </head>
+            <body><p>Text</p></body>
+        </html>
+    '''
+
+    def test_extract_metadata(self):
+        """Test extract_metadata from a string and from an lxml tree."""
+        meta = extract_metadata(self.D1)
+        self.assertEqual(u'Citation title', meta['title'])
+        self.assertEqual([u'John', u'Jane'], [a['firstname'] for a in meta['authors']])
+        self.assertEqual(u'12-15', meta['page'])
+        self.assertEqual({u'crystals', u'polymorphism'}, set(meta['keywords']))
+        self.assertEqual(u'CC-BY', meta['license'])
+        self.assertEqual(u'paper.xml', meta['xml_url'])
+        self.assertEqual(meta, extract_metadata(etree.fromstring(self.D1, etree.HTMLParser())))
+
+    def test_extract_metadata_empty(self):
+        """Test extract_metadata from an empty or whitespace-only page."""
+        for html in ['', ' ', '\n', '<html></html>']:
+            self.assertEqual({}, extract_metadata(html))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for scrape package."""
+
+import datetime
+import unittest
+
+from scrapy import Request, Selector
+from scrapy.exceptions import IgnoreRequest
+from twisted.internet import defer
+
+from lmtk.scrape.items import Figure, Paper
+from lmtk.scrape.middleware import MongoDBDuplicateMiddleware
+from lmtk.scrape.pipelines import MongoDBPipeline
+from lmtk.scrape.router import SpiderRouter, _pattern_host
+from lmtk.scrape.spiders.generic import GenericSpider, can_combine, _split_literal_prefix
+from lmtk.scrape.spiders.rsc import RscFigureLoader, RscSubstanceLoader
+
+
+def _get(doc, key):
+    """Get the value of a dotted key in a nested doc."""
+    for k in key.split('.'):
+        doc = doc.get(k, {})
+    return doc
+
+
+def _matches(doc, spec):
+    """Return True if a doc has the value of every dotted key in spec."""
+    return all(_get(doc, k) == v for k, v in spec.items())
+
+
+def _set(doc, key, value):
+    """Set the value of a dotted key in a nested doc."""
+    keys = key.split('.')
+    for k in keys[:-1]:
+        doc = doc.setdefault(k, {})
+    doc[keys[-1]] = value
+
+
+class Collection(object):
+    """An in-process stand-in for a MongoDB collection of scrapes."""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.indexes = []
+        self.failures = 0
+
+    def create_index(self, key):
+        self.indexes.append(key)
+
+    def find(self, spec, fields=None):
+        if '$or' in spec:
+            return [doc for doc in self.docs if any(_matches(doc, s) for s in spec['$or'])]
+        since = spec['scrape.updated']['$gte']
+        return [doc for doc in self.docs if doc['scrape']['updated'] >= since]
+
+    def initialize_ordered_bulk_op(self):
+        return BulkOperation(self)
+
+
+class BulkOperation(object):
+    """An in-process stand-in for a MongoDB bulk operation that only supports updating single docs."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.updates = []
+
+    def find(self, spec):
+        self.spec = spec
+        self._upsert = False
+        return self
+
+    def upsert(self):
+        self._upsert = True
+        return self
+
+    def update_one(self, update):
+        self.updates.append((self.spec, update, self._upsert))
+
+    def execute(self):
+        if self.collection.failures:
+            self.collection.failures -= 1
+            raise IOError('Write failed')
+        for spec, update, upsert in self.updates:
+            docs = [doc for doc in self.collection.docs if _matches(doc, spec)]
+            if docs:
+                doc = docs[0]
+            elif not upsert:
+                continue
+            else:
+                doc = {}
+                self.collection.docs.append(doc)
+                for key, value in list(spec.items()) + list(update.get('$setOnInsert', {}).items()):
+                    _set(doc, key, value)
+            for key, value in update['$set'].items():
+                _set(doc, key, value)
+            for key in update.get('$unset', {}):
+                doc.pop(key, None)
+
+
+class Lock(object):
+    """A stand-in for a DeferredLock that runs the function given to deferToThread straight away."""
+
+    def run(self, deferToThread, f, *args):
+        return defer.maybeDeferred(f, *args)
+
+
+class Stats(object):
+    """An in-process stand-in for a stats collector."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get_value(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set_value(self, key, value):
+        self.values[key] = value
+
+    def inc_value(self, key, count=1):
+        self.values[key] = self.values.get(key, 0) + count
+
+
+class Spider(GenericSpider):
+    """A spider with parserules for articles and issues."""
+    name = 'example'
+    article_url = r'example\.com/article/'
+    article_lifetime = 7
+    issue_url = r'example\.com/issue/'
+
+
+class OverlapSpider(GenericSpider):
+    """A spider with parserules that overlap, share literal prefixes and have ignore patterns."""
+    name = 'overlap'
+    article_url = r'http://example\.com/article/\d+'
+    full_url = r'http://example\.com/article/\d+/full'
+    full_ignore = r'/full/pdf'
+    any_url = r'http://example\.com/'
+    any_ignore = r'\?print'
+    image_url = r'\.(png|jpe?g)$'
+
+
+class SeparateSpider(OverlapSpider):
+    """A spider with parserules that can't be combined into one regex."""
+    name = 'separate'
+    article_url = r'(?i)HTTP://EXAMPLE\.COM/ARTICLE/\d+'
+    host_url = r'http://(\w+)\.example\.com/\1/'
+    any_url = r'http://example\.com/'
+    any_ignore = r'\?print'
+
+
+class TestParseRules(unittest.TestCase):
+
+    urls = [
+        'http://example.com/article/1',
+        'http://example.com/article/1/full',
+        'http://example.com/article/1/full/pdf',
+        'http://example.com/article/1/full/fig.png',
+        'http://example.com/article/1?print',
+        'http://example.com/issue/1.jpeg',
+        'http://other.org/example.com/article/2',
+        'http://pubs.example.com/pubs/1',
+        'http://pubs.example.com/other/1',
+        'http://other.org/',
+    ]
+
+    def test_split_literal_prefix(self):
+        """Test patterns are split into the literal text that every match starts with and the rest."""
+        self.assertEqual(('http://pubs.rsc.org/en/', '[Cc]ontent'),
+                         _split_literal_prefix(r'http://pubs\.rsc\.org/en/[Cc]ontent'))
+        self.assertEqual(('ab', 'c?d'), _split_literal_prefix('abc?d'))
+        self.assertEqual(('ab', 'c{2}'), _split_literal_prefix('abc{2}'))
+        self.assertEqual(('', 'a|b'), _split_literal_prefix('a|b'))
+        self.assertEqual(('', '(a)|b'), _split_literal_prefix('(a)|b'))
+        self.assertEqual(('', '[|]x'), _split_literal_prefix('[|]x'))
+        self.assertEqual(('a|b', ''), _split_literal_prefix(r'a\|b'))
+        self.assertEqual(('', '^a'), _split_literal_prefix('^a'))
+        self.assertEqual(('a', r'\d'), _split_literal_prefix(r'a\d'))
+
+    def test_can_combine(self):
+        """Test patterns with backreferences, conditionals or inline flags are kept out of combined regexes."""
+        self.assertTrue(can_combine(r'http://example\.com/(\w+)/\d'))
+        self.assertTrue(can_combine(r'a[\1]\0'))
+        self.assertFalse(can_combine(r'http://(\w+)\.example\.com/(\1)'))
+        self.assertFalse(can_combine(r'(a)?(?(1)b|c)'))
+        self.assertFalse(can_combine(r'(?i)example\.com'))
+
+    def assert_matches(self, spider):
+        """Assert the parserules found for each url are those that match when searching with each one in turn."""
+        for url in self.urls:
+            expected = tuple(i for i, rule in enumerate(spider.parserules)
+                             if rule.url.search(url) and not (rule.ignore and rule.ignore.search(url)))
+            self.assertEqual(expected, spider._match_parserules(url))
+
+    def test_match_parserules(self):
+        """Test the combined search finds the same parserules as searching with each one in turn."""
+        spider = OverlapSpider()
+        self.assertIsNotNone(spider._parserule_regex)
+        self.assert_matches(spider)
+        self.assertEqual(3, len(spider.parserules_for(Request('http://example.com/article/1/full'))))
+
+    def test_match_parserules_separately(self):
+        """Test parserules that can't be combined are searched in turn."""
+        spider = SeparateSpider()
+        self.assertIsNone(spider._parserule_regex)
+        self.assert_matches(spider)
+
+    def test_parserules_for_cache(self):
+        """Test matching parserules are cached on the request meta, and found again if the request url changes."""
+        spider = OverlapSpider()
+        calls = []
+        match = spider._match_parserules
+        spider._match_parserules = lambda url: calls.append(url) or match(url)
+        request = Request('http://example.com/article/1')
+        rules = spider.parserules_for(request)
+        self.assertEqual(rules, spider.parserules_for(request))
+        self.assertEqual(['http://example.com/article/1'], calls)
+        self.assertEqual('http://example.com/article/1', request.meta['parserules'][0])
+        redirected = Request('http://example.com/article/1/full', meta=request.meta)
+        self.assertEqual(3, len(spider.parserules_for(redirected)))
+        self.assertEqual(['http://example.com/article/1', 'http://example.com/article/1/full'], calls)
+        self.assertEqual('http://example.com/article/1/full', redirected.meta['parserules'][0])
+
+
+class RscSpider(GenericSpider):
+    name = 'rsc'
+    crawl = [r'http://pubs\.rsc\.org/en/', r'http://(xlink|feeds)\.rsc\.org/']
+    ignore = [r'/pdf/']
+    dois = ['10.1039']
+
+
+class RscContentSpider(GenericSpider):
+    name = 'rsccontent'
+    crawl = [r'http://pubs\.rsc\.org/en/content/']
+
+
+class PdfSpider(GenericSpider):
+    name = 'pdf'
+    crawl = [r'\.pdf$']
+
+
+class ExampleSpider(GenericSpider):
+    name = 'example'
+    crawl = [r'http://(\w+)\.example\.com/\1/', r'(?i)http://EXAMPLE\.org/', r'http://(?P<n>a)\.example\.com/',
+             r'http://(?P<n>b)\.example\.com/']
+    dois = ['10.1000']
+
+
+class TestSpiderRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = SpiderRouter([RscSpider, RscContentSpider, PdfSpider, ExampleSpider])
+
+    def test_pattern_host(self):
+        """Test patterns are indexed by the literal end of their host."""
+        self.assertEqual('pubs.rsc.org', _pattern_host(r'http://pubs\.rsc\.org/en/'))
+        self.assertEqual('rsc.org', _pattern_host(r'http://(xlink|feeds)\.rsc\.org/'))
+        self.assertEqual('www.example.com', _pattern_host(r'^https?://www\.Example\.com/'))
+        self.assertIsNone(_pattern_host(r'\.pdf$'))
+        self.assertIsNone(_pattern_host(r'http://localhost/'))
+        self.assertEqual({'pubs.rsc.org', 'rsc.org', 'example.com', None}, set(self.router._patterns))
+
+    def test_spider_for(self):
+        """Test URLs are routed to the spider with a pattern that matches their host."""
+        self.assertEqual(RscSpider, self.router.spider_for('http://pubs.rsc.org/en/journals/journalissues/cc'))
+        self.assertEqual(RscSpider, self.router.spider_for('http://feeds.rsc.org/rss/cc'))
+        self.assertIsNone(self.router.spider_for('http://www.rsc.org/'))
+        # Patterns without a literal host are checked for every url
+        self.assertEqual(PdfSpider, self.router.spider_for('http://other.org/paper.pdf'))
+
+    def test_priority(self):
+        """Test the spider registered first is chosen when more than one can handle a URL."""
+        url = 'http://pubs.rsc.org/en/content/articlelanding/2014/cc/c4cc01234a'
+        self.assertEqual(RscSpider, self.router.spider_for(url))
+        self.assertEqual(RscContentSpider, SpiderRouter([RscContentSpider, RscSpider]).spider_for(url))
+        self.assertEqual(RscSpider, self.router.spider_for('http://pubs.rsc.org/en/content/paper.pdf'))
+        self.assertEqual(PdfSpider, SpiderRouter([PdfSpider, RscSpider]).spider_for('http://pubs.rsc.org/en/a.pdf'))
+
+    def test_ignore(self):
+        """Test the other spiders are checked when the matched spider ignores a URL."""
+        self.assertEqual(RscContentSpider, self.router.spider_for('http://pubs.rsc.org/en/content/pdf/c4cc01234a'))
+        self.assertIsNone(self.router.spider_for('http://pubs.rsc.org/en/journals/pdf/cc'))
+
+    def test_separate_patterns(self):
+        """Test patterns with backreferences, inline flags or repeated group names are matched on their own."""
+        self.assertEqual(ExampleSpider, self.router.spider_for('http://pubs.example.com/pubs/1'))
+        self.assertIsNone(self.router.spider_for('http://pubs.example.com/other/1'))
+        self.assertEqual(ExampleSpider, self.router.spider_for('http://example.org/1'))
+        self.assertEqual(ExampleSpider, self.router.spider_for('http://b.example.com/1'))
+        self.assertFalse(RscSpider.handles_url('HTTP://PUBS.RSC.ORG/en/'))
+
+    def test_route(self):
+        """Test DOIs are routed by their prefix, with or without a doi: prefix, and unrouted targets are returned."""
+        self.assertEqual(RscSpider, self.router.spider_for_doi('10.1039/c4cc01234a'))
+        self.assertIsNone(self.router.spider_for_doi('10.1016/j.cell.2014.01.001'))
+        routes, unrouted = self.router.route([
+            '10.1039/c4cc01234a',
+            ' doi:10.1000/182',
+            'DOI: 10.1039/c4cc04321a',
+            'http://pubs.rsc.org/en/journals/journalissues/cc',
+            '10.1016/j.cell.2014.01.001',
+            'http://www.rsc.org/',
+            'not a url',
+        ])
+        self.assertEqual({
+            RscSpider: ['http://dx.doi.org/10.1039/c4cc01234a', 'http://dx.doi.org/10.1039/c4cc04321a',
+                        'http://pubs.rsc.org/en/journals/journalissues/cc'],
+            ExampleSpider: ['http://dx.doi.org/10.1000/182'],
+        }, routes)
+        self.assertEqual(['10.1016/j.cell.2014.01.001', 'http://www.rsc.org/', 'not a url'], unrouted)
+
+
+class TestMongoDBDuplicateMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        now = datetime.datetime.utcnow()
+        self.collection = Collection([
+            {'scrape': {'url': 'http://example.com/article/1', 'updated': now - datetime.timedelta(days=30)}},
+            {'scrape': {'url': 'http://example.com/article/2', 'updated': now - datetime.timedelta(days=30)}},
+            {'scrape': {'url': 'http://example.com/article/2', 'updated': now - datetime.timedelta(days=2)}},
+            {'scrape': {'url': 'http://example.com/issue/1', 'updated': now}},
+        ])
+        self.spider = Spider()
+        self.middleware = MongoDBDuplicateMiddleware({}, collection=self.collection)
+        self.middleware.spider_opened(self.spider)
+
+    def tearDown(self):
+        self.middleware.spider_closed(self.spider)
+
+    def test_indexes(self):
+        """Test indexes are ensured on startup."""
+        self.assertEqual(['scrape.url', 'scrape.updated'], self.collection.indexes)
+
+    def test_recent_scrapes(self):
+        """Test only scrapes within the lifetime window are loaded, with the latest time for each url."""
+        self.assertEqual({'http://example.com/article/2', 'http://example.com/issue/1'}, set(self.middleware.updated))
+        self.assertEqual(self.collection.docs[2]['scrape']['updated'],
+                         self.middleware.updated['http://example.com/article/2'])
+
+    def test_process_request(self):
+        """Test requests are ignored if they were scraped within the lifetime of their parserule."""
+        process = lambda url: self.middleware.process_request(Request(url), self.spider)
+        self.assertRaises(IgnoreRequest, process, 'http://example.com/article/2')
+        self.assertIsNone(process('http://example.com/article/1'))
+        self.assertIsNone(process('http://example.com/article/3'))
+        # Parserules without a lifetime are always scraped
+        self.assertIsNone(process('http://example.com/issue/1'))
+        # Newly scraped items are ignored without waiting for a refresh
+        self.middleware.item_scraped({'scrape': {'url': 'http://example.com/article/3'}}, None, self.spider)
+        self.assertRaises(IgnoreRequest, process, 'http://example.com/article/3')
+
+    def test_merge(self):
+        """Test refreshed scrapes are merged in, keeping the latest time for each url."""
+        now = datetime.datetime.utcnow()
+        self.middleware._merge([('http://example.com/article/1', now),
+                                ('http://example.com/article/2', now - datetime.timedelta(days=10))])
+        self.assertEqual(now, self.middleware.updated['http://example.com/article/1'])
+        self.assertEqual(self.collection.docs[2]['scrape']['updated'],
+                         self.middleware.updated['http://example.com/article/2'])
+        self.assertEqual(now, self.middleware._since)
+
+
+class TestMongoDBPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = Collection()
+        self.pipeline = MongoDBPipeline({}, collection=self.collection)
+
+    def process(self, **fields):
+        """Process a paper scraped from the same url by the same parser."""
+        scrape = {'url': 'http://example.com/article/1', 'spider': 'example', 'parser': 'parse_html'}
+        return self.pipeline.process_item(Paper(scrape=scrape, **fields), None)
+
+    def test_bulk_upsert(self):
+        """Test buffered items are upserted by DOI, spider and parser, replacing all but the created time."""
+        self.process(doi='10.1039/a', title='First title', abstract='Abstract')
+        self.process(doi='10.1039/b', title='Other paper')
+        self.assertEqual(0, len(self.collection.docs))
+        batch, self.pipeline._buffer = self.pipeline._buffer, []
+        self.assertEqual({'new': 2, 'updated': 0, 'unchanged': 0}, self.pipeline._write(batch))
+        self.assertEqual(2, len(self.collection.docs))
+        created = self.collection.docs[0]['scrape']['created']
+        self.process(doi='10.1039/a', title='Second title')
+        self.assertEqual({'new': 0, 'updated': 1, 'unchanged': 0}, self.pipeline._write(self.pipeline._buffer))
+        self.assertEqual(2, len(self.collection.docs))
+        doc = self.collection.docs[0]
+        self.assertEqual('Second title', doc['title'])
+        self.assertNotIn('abstract', doc)
+        self.assertEqual(created, doc['scrape']['created'])
+        self.assertGreaterEqual(doc['scrape']['updated'], created)
+        self.assertEqual('http://example.com/article/1', doc['scrape']['url'])
+
+    def test_retry(self):
+        """Test a batch that fails to be written is written before newer items on the next flush."""
+        self.pipeline._lock = Lock()
+        self.pipeline.stats = Stats()
+        self.collection.failures = 2
+        self.process(doi='10.1039/a', title='First')
+        self.pipeline.flush()
+        self.assertEqual(0, len(self.collection.docs))
+        self.assertEqual(1, len(self.pipeline._retry))
+        self.process(doi='10.1039/b', title='Other')
+        self.pipeline.flush()
+        self.assertEqual(['10.1039/b'], [doc['doi'] for doc in self.collection.docs])
+        self.process(doi='10.1039/a', title='Second')
+        self.pipeline.flush()
+        self.assertEqual(['10.1039/b', '10.1039/a'], [doc['doi'] for doc in self.collection.docs])
+        self.assertEqual('Second', self.collection.docs[1]['title'])
+        self.assertEqual([], self.pipeline._retry)
+        self.assertEqual(3, self.pipeline.stats.get_value('mongodb/items_saved'))
+        self.assertIsNone(self.pipeline.stats.get_value('mongodb/items_failed'))
+
+    def test_failed(self):
+        """Test items are counted as failed once their batch runs out of retries, including when the spider closes."""
+        self.pipeline = MongoDBPipeline({'MONGODB_RETRIES': 1}, stats=Stats(), collection=self.collection)
+        self.pipeline._lock = Lock()
+        self.collection.failures = 3
+        self.process(doi='10.1039/a', title='First')
+        self.process(doi='10.1039/b', title='Other')
+        self.pipeline.flush()
+        self.pipeline.flush()
+        self.assertEqual(2, self.pipeline.stats.get_value('mongodb/items_failed'))
+        self.assertEqual([], self.pipeline._retry)
+        self.process(doi='10.1039/c', title='Last')
+        self.pipeline.close_spider(None)
+        self.assertEqual(['10.1039/c'], [doc['doi'] for doc in self.collection.docs])
+        self.assertEqual(2, self.pipeline._items_failed)
+
+    def test_unchanged(self):
+        """Test items scraped again without changes only have their updated time changed."""
+        self.process(doi='10.1039/a', title='Title', author=['Smith, John', 'Doe, Jane'])
+        self.pipeline._write(self.pipeline._buffer)
+        doc = self.collection.docs[0]
+        content_hash, updated = doc['scrape']['hash'], doc['scrape']['updated']
+        doc['title'] = 'Edited'
+        self.pipeline._buffer = []
+        self.process(author=['Smith, John', 'Doe, Jane'], title='Title', doi='10.1039/a')
+        self.assertEqual({'new': 0, 'updated': 0, 'unchanged': 1}, self.pipeline._write(self.pipeline._buffer))
+        self.assertEqual('Edited', doc['title'])
+        self.assertEqual(content_hash, doc['scrape']['hash'])
+        self.assertGreaterEqual(doc['scrape']['updated'], updated)
+        # Reordering a list is a change
+        self.pipeline._buffer = []
+        self.process(doi='10.1039/a', title='Title', author=['Doe, Jane', 'Smith, John'])
+        self.assertEqual({'new': 0, 'updated': 1, 'unchanged': 0}, self.pipeline._write(self.pipeline._buffer))
+        self.assertEqual('Title', doc['title'])
+
+
+
+class TestRscLoaders(unittest.TestCase):
+
+    def test_empty_caption(self):
+        """Test empty and whitespace-only captions and labels are dropped rather than failing the item."""
+        html = ('<div class="image_table"><span class="graphic_title"></span><td class="imgHolder">'
+                '<img alt="" src="a.gif"><img alt=" " src="b.gif"><img alt="<i>A</i> figure" src="c.gif"></td></div>')
+        selector = Selector(text=html)
+        l = RscFigureLoader(item=Figure(), selector=selector)
+        l.add_value('caption', selector.xpath('.//span[@class="graphic_title"]'))
+        l.add_xpath('caption', './/td[@class="imgHolder"]//img/@alt')
+        self.assertEqual('A figure', l.load_item()['caption'])
+        l = RscSubstanceLoader(selector=Selector(text='<b> </b>'))
+        l.add_value('label', ['', '\n'])
+        l.add_xpath('label', '//b')
+        self.assertNotIn('label', l.load_item())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 """Unit tests for text package."""
 
+import re
 import unittest
 
-from lmtk.text import Unhyphenator, normalize, latex_to_unicode, extract_urls, extract_emails
+from lmtk.text import Unhyphenator, normalize, latex_to_unicode, extract_urls, extract_emails, levenshtein, levenshtein_many, \
+    trie_pattern
 
 
 class TestUnhyphenator(unittest.TestCase):
@@ -55,6 +57,14 @@ class TestNormalization(unittest.TestCase):
         # u2024 instead of full stop
         self.assertEqual(u'www.bbc.co.uk', normalize(u'www\u2024bbc\u2024co\u2024uk'))
 
+    def test_normalize_quotes_newlines(self):
+        """Test normalize function with separate double quotes and newlines."""
+        self.assertEqual(u'\u201cquoted\u201d and \u201cmore\u201d', normalize(u'``quoted\'\' and "\u2018more\u2019\''))
+        self.assertEqual(u'\u201dquoted\u201d', normalize(u'\'\u0003\'quoted\'\''))
+        self.assertEqual(u'a-b-cd', normalize(u'a\u2013b\u2212c\u00ADd'))
+        self.assertEqual(u'one\ntwo\nthree\nfour', normalize(u'one\r\ntwo\rthree\u2028four', collapse=False))
+        self.assertEqual(u'one two three four', normalize(u'one\r\ntwo\rthree\u2028four'))
+
 
 class TestLaTeX(unittest.TestCase):
 
@@ -90,6 +100,75 @@ class TestLaTeX(unittest.TestCase):
         self.assertEqual(u'Of k-trees Is O(k)',
                          latex_to_unicode('of \\mbox{$k$-trees} is {$O(k)$}', capitalize='title'))
 
+    def test_latex_to_unicode_entities(self):
+        self.assertEqual(u'Schr\xf6dinger', latex_to_unicode('Schr\\"odinger'))
+        self.assertEqual(u'G\xf6del', latex_to_unicode('G\\"{o}del'))
+        self.assertEqual(u'Erdős', latex_to_unicode('Erd\\H{o}s'))
+        self.assertEqual(u'na\xefve', latex_to_unicode('na\\"{\\i}ve'))
+        self.assertEqual(u'Zhang', latex_to_unicode('\\noopsort{b}Zhang'))
+        self.assertEqual(u'50% and $x_1$', latex_to_unicode('50\\% and \\$x\\_1\\$'))
+        # Longest match wins over substrings
+        self.assertEqual(u'∫x', latex_to_unicode('\\int x'))
+        # Math font contents are decoded in context
+        self.assertEqual(u'αhelix', latex_to_unicode('\\mathbf{\\alpha} helix'))
+        self.assertEqual(u'xy ' * 1000, latex_to_unicode('\\mathbf{x}\\mathrm{y} ' * 1000))
+
+    def test_latex_to_unicode_noopsort_path(self):
+        # Path contents are decoded and unescaped
+        self.assertEqual(u'http://x.org/a_b', latex_to_unicode('\\path|http://x.org/a\\_b|'))
+        self.assertEqual(u'10.1039/c3ce&27', latex_to_unicode('\\path|10.1039/c3ce\\&27|'))
+        self.assertEqual(u'see \\path|α', latex_to_unicode('see \\path|\\alpha '))
+        # Noopsort ends at the first closing brace, even when nested
+        self.assertEqual(u'bZhang', latex_to_unicode('\\noopsort{{a}b}Zhang'))
+        self.assertEqual(u'Zhang', latex_to_unicode('\\noopsort{\\"{o}}Zhang'))
+        # Like the path delimiters, the closing brace must be on the same line
+        self.assertEqual(u'\\noopsorta\nbc', latex_to_unicode('\\noopsort{a\nb}c'))
+
+
+class TestLevenshtein(unittest.TestCase):
+
+    def test_levenshtein(self):
+        self.assertEqual(3, levenshtein(u'kitten', u'sitting'))
+        self.assertEqual(3, levenshtein(u'sitting', u'kitten'))
+        self.assertEqual(0, levenshtein(u'', u''))
+        self.assertEqual(5, levenshtein(u'', u'hello'))
+        self.assertEqual(6, levenshtein(u'hello ', u''))
+        self.assertEqual(6, levenshtein(u'hello', u'hello there'))
+        self.assertEqual(0, levenshtein(u'hello', u'hello there', allow_substring=True))
+        self.assertEqual(1, levenshtein(u'hallo', u'oh hello there', allow_substring=True))
+        # Long strings beyond a single machine word
+        title = u'Self-metathesis of fatty acid methyl esters: full conversion by choosing the appropriate plant oil'
+        self.assertEqual(2, levenshtein(title, title.replace(u'full', u'fall').replace(u'oil', u'oils')))
+
+    def test_levenshtein_max_distance(self):
+        self.assertEqual(3, levenshtein(u'kitten', u'sitting', max_distance=3))
+        self.assertEqual(3, levenshtein(u'kitten', u'sitting', max_distance=2))
+        self.assertEqual(2, levenshtein(u'a', u'abcdefgh', max_distance=1))
+        self.assertEqual(2, levenshtein(u'xyz', u'hello there', allow_substring=True, max_distance=1))
+        self.assertEqual([(u'sitting', 3), (u'kitten', 0)],
+                         levenshtein_many(u'kitten', [u'sitting', u'kitchen sink', u'kitten'], max_distance=3))
+        self.assertEqual([(u'kitchen sink', 1)],
+                         levenshtein_many(u'kichen', [u'sitting', u'kitchen sink'], max_distance=1, allow_substring=True))
+
+
+class TestTriePattern(unittest.TestCase):
+
+    def test_trie_pattern(self):
+        self.assertEqual(r'\.(?:c[ado]|uk)', trie_pattern(['.ca', '.cd', '.co', '.uk']))
+        self.assertEqual(r'ab(?:c(?:de)?)?', trie_pattern(['ab', 'abc', 'abcde']))
+        self.assertEqual(r'acid', trie_pattern(['acid', 'ACID', 'Acid'], ignorecase=True))
+        self.assertEqual(r'ethyl(?:\s?acetate)?', trie_pattern(['ethyl', 'ethyl acetate'], fragments={' ': r'\s?'}))
+
+    def test_trie_pattern_matches(self):
+        words = ['in', 'inter', 'intra', 'iso', 'is', 'a+b', 'a.b']
+        regex = re.compile(r'^(%s)$' % trie_pattern(words))
+        for word in words:
+            self.assertTrue(regex.match(word))
+        for word in ['', 'i', 'int', 'isoo', 'a+', 'aab', 'axb']:
+            self.assertFalse(regex.match(word))
+        # Longest word wins when searching
+        self.assertEqual(['intra', 'is'], re.findall(trie_pattern(words), 'intra is'))
+
 
 class TestExtraction(unittest.TestCase):
 
@@ -99,6 +178,7 @@ class TestExtraction(unittest.TestCase):
                          extract_urls('Go to example.com/test. (Or google.ca:80/hello.)'))
         self.assertEqual([u'http://bit.ly/17YdfI9', u'bit.ly/17YdfI9'],
                          extract_urls('Check out http://bit.ly/17YdfI9 and bit.ly/17YdfI9'))
+        self.assertEqual([u'example.co.uk'], extract_urls('The outcome: unclear. See example.co.uk.'))
 
     def test_extract_emails(self):
         """Test extract_urls function."""
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for utils module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lmtk.utils import SortedWordList, per_class_property, shared_property, word_list
+
+
+class TestWordList(unittest.TestCase):
+
+    def test_word_list_shared(self):
+        """Test word lists are only loaded once."""
+        self.assertIs(word_list('lastnames'), word_list('lastnames'))
+        self.assertIn(u'Swain', word_list('lastnames'))
+        self.assertNotIn(u'swain', word_list('lastnames'))
+
+    def test_sorted_word_list(self):
+        """Test membership in a memory-mapped sorted word list."""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'words.sorted')
+            words = [u'', u'apple', u'banana', u'cherry', u'dur', u'durian', u'fig', u'na\xefve']
+            with open(path, 'wb') as f:
+                f.write(b'\n'.join(sorted(w.encode('utf-8') for w in words)))
+            sorted_words = SortedWordList(path)
+            for word in words:
+                self.assertIn(word, sorted_words)
+            for word in [u'a', u'appl', u'apples', u'd', u'duri', u'zebra', u'naive']:
+                self.assertNotIn(word, sorted_words)
+            self.assertEqual(len(words), len(sorted_words))
+            self.assertEqual(sorted(words), list(sorted_words))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_shared_property(self):
+        """Test shared properties are computed once and can be overridden per instance."""
+        calls = []
+
+        class Example(object):
+            @shared_property
+            def words(cls):
+                calls.append(cls)
+                return frozenset([u'a'])
+
+        a, b = Example(), Example()
+        self.assertIs(a.words, b.words)
+        self.assertEqual(1, len(calls))
+        b.words = frozenset([u'b'])
+        self.assertEqual(frozenset([u'a']), a.words)
+        self.assertEqual(frozenset([u'b']), b.words)
+
+    def test_per_class_property(self):
+        """Test per-class properties are computed once for each class, even after the base class."""
+        class Example(object):
+            letters = u'ab'
+
+            @per_class_property
+            def words(cls):
+                return frozenset(cls.letters)
+
+        class Subclass(Example):
+            letters = u'cd'
+
+        a, b = Example(), Subclass()
+        self.assertEqual(frozenset(u'ab'), a.words)
+        self.assertEqual(frozenset(u'cd'), b.words)
+        self.assertIs(a.words, Example().words)
+        self.assertIs(b.words, Subclass().words)
+        b.words = frozenset(u'e')
+        self.assertEqual(frozenset(u'cd'), Subclass().words)
+
+
+if __name__ == '__main__':
+    unittest.main()